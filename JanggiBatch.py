@@ -0,0 +1,170 @@
+# Description: Vectorized evaluation of many JanggiGame positions at once with NumPy.
+# N positions are stacked into an (N, 10, 9) int8 array of piece codes, and every feature is computed for all N
+# together with array operations: material, piece-square scores, attacked squares and palace control.
+# Attack maps are computed on bit-packed masks: a (10, 9, N / 64) uint64 array holds one bit per position for every
+# square, so a shift, AND or OR handles 64 positions per element. Chariot and cannon rays along rows and columns
+# advance one square per shift while the square reached is empty; every other move (horse and elephant leaps,
+# soldiers, the palace pieces, the palace diagonals) is a shift of the pieces standing on the squares it starts
+# from, masked by the squares it passes over. Those moves come from the pieces' empty-board move tables.
+# NumPy is only needed by this module; JanggiGame itself does not depend on it.
+
+import numpy as np
+
+from JanggiGame import NUM_ROWS, NUM_COLS, NUM_SQUARES, BLUE_BIT, TYPE_MASK, PIECES, CHARIOT, CANNON
+from JanggiSearch import PIECE_VALUES, PIECE_SQUARE_SCORES
+
+# value of every piece code, positive for Blue and negative for Red
+_MATERIAL = np.array([0 if not code & TYPE_MASK else
+                      PIECE_VALUES[code & TYPE_MASK] * (1 if code & BLUE_BIT else -1)
+                      for code in range(2 * BLUE_BIT)], dtype=np.int32)
+_PIECE_SQUARE = np.array(PIECE_SQUARE_SCORES, dtype=np.int32)          # (16, NUM_SQUARES), material included
+_SQUARES = np.arange(NUM_SQUARES)
+
+# squares of the Red palace (rows 1-3) and of the Blue palace (rows 8-10)
+_RED_PALACE = np.zeros(NUM_SQUARES, dtype=bool)
+_BLUE_PALACE = np.zeros(NUM_SQUARES, dtype=bool)
+for _row in range(3):
+    _RED_PALACE[_row * NUM_COLS + 3:_row * NUM_COLS + 6] = True
+    _BLUE_PALACE[(NUM_ROWS - 1 - _row) * NUM_COLS + 3:(NUM_ROWS - 1 - _row) * NUM_COLS + 6] = True
+del _row
+
+_ORTHOGONAL = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+def _build_patterns(code):
+    """
+    Group the empty-board moves of a piece code by shape. Return a list of (step, offsets, from mask) where step is
+    the (row, column) move, offsets the squares passed over relative to the start, and from mask the (10, 9, 1)
+    uint64 mask, all ones on the squares the move can start from. The rays of chariots and cannons along rows and
+    columns are left out; for cannons, only the diagonal jumps over the palace centre are kept.
+    """
+    patterns = {}
+    piece_type = code & TYPE_MASK
+    for pos in range(NUM_SQUARES):
+        from_row, from_col = divmod(pos, NUM_COLS)
+        for target, passed in PIECES[code].get_empty_board_moves(pos):
+            row, col = divmod(target, NUM_COLS)
+            if piece_type in (CHARIOT, CANNON) and (row == from_row or col == from_col):
+                continue
+            if piece_type == CANNON and len(passed) != 1:
+                continue
+            offsets = tuple((sq // NUM_COLS - from_row, sq % NUM_COLS - from_col) for sq in passed)
+            mask = patterns.setdefault(((row - from_row, col - from_col), offsets),
+                                       np.zeros((NUM_ROWS, NUM_COLS, 1), dtype=np.uint64))
+            mask[from_row, from_col] = ~np.uint64(0)
+    return [(step, offsets, mask) for (step, offsets), mask in patterns.items()]
+
+
+_PATTERNS = {code: _build_patterns(code) for code in range(2 * BLUE_BIT) if PIECES[code]}
+
+
+def _shift(mask, step):
+    """Shift a (10, 9, w) mask by a (row, column) step; squares moved off the board are dropped."""
+    d_row, d_col = step
+    shifted = np.zeros_like(mask)
+    shifted[max(d_row, 0):NUM_ROWS + min(d_row, 0), max(d_col, 0):NUM_COLS + min(d_col, 0)] = \
+        mask[max(-d_row, 0):NUM_ROWS + min(-d_row, 0), max(-d_col, 0):NUM_COLS + min(-d_col, 0)]
+    return shifted
+
+
+def _pack(mask):
+    """Pack a (10, 9, n) bool mask, n a multiple of 64, into a (10, 9, n / 64) uint64 mask."""
+    return np.packbits(mask, axis=2, bitorder="little").view(np.uint64)
+
+
+def stack_boards(positions):
+    """
+    Stack positions into an (N, 10, 9) int8 array of piece codes (see PIECES).
+    A position is a JanggiGame or a board buffer of NUM_SQUARES bytes, such as JanggiGame.get_board().
+    """
+    buffers = [bytes(position.get_board()) if hasattr(position, "get_board") else bytes(position)
+               for position in positions]
+    return np.frombuffer(b"".join(buffers), dtype=np.int8).reshape(len(buffers), NUM_ROWS, NUM_COLS)
+
+
+def _side_attacks(codes, color_bit, empty, screens, not_cannons):
+    """
+    Get the squares one side attacks as a packed (10, 9, w) mask. codes are the boards as a (10, 9, n) array;
+    empty, screens (pieces a cannon can jump) and not_cannons are packed masks of the same boards.
+    """
+    attacked = np.zeros_like(empty)
+    own = {code: _pack(codes == code) for code in range(color_bit, color_bit + BLUE_BIT) if PIECES[code]}
+
+    # chariots slide until the first piece; cannons jump exactly one screen and never land on a cannon
+    for direction in _ORTHOGONAL:
+        chariots = own[CHARIOT | color_bit]
+        before_screen = own[CANNON | color_bit]
+        after_screen = np.zeros_like(empty)
+        for _ in range(max(NUM_ROWS, NUM_COLS) - 1):
+            chariots = _shift(chariots, direction)
+            attacked |= chariots
+            chariots &= empty
+            before_screen = _shift(before_screen, direction)
+            after_screen = _shift(after_screen, direction)
+            attacked |= after_screen & not_cannons
+            after_screen = (after_screen & empty) | (before_screen & screens)
+            before_screen &= empty
+
+    for code, pieces in own.items():
+        is_cannon = code & TYPE_MASK == CANNON
+        for step, offsets, from_mask in _PATTERNS[code]:
+            moving = pieces & from_mask
+            if not moving.any():
+                continue
+            for offset in offsets:
+                # the square passed over, seen from the start square; the cannon's must be its screen
+                moving &= _shift(screens if is_cannon else empty, (-offset[0], -offset[1]))
+            reached = _shift(moving, step)
+            attacked |= reached & not_cannons if is_cannon else reached
+    return attacked
+
+
+def attack_maps(boards, chunk_size=1 << 14):
+    """
+    Get the squares attacked by each side for a stack of boards, as two (N, NUM_SQUARES) bool arrays for Blue and Red.
+    A square counts as attacked whatever stands on it, own pieces included, except that a cannon never attacks a cannon.
+    """
+    flat = np.asarray(boards, dtype=np.int8).reshape(-1, NUM_SQUARES)
+    blue = np.empty(flat.shape, dtype=bool)
+    red = np.empty(flat.shape, dtype=bool)
+    for start in range(0, len(flat), chunk_size):
+        chunk = flat[start:start + chunk_size]
+        count = len(chunk)
+        # positions last, padded with empty boards to a multiple of 64
+        codes = np.zeros((NUM_SQUARES, -(-count // 64) * 64), dtype=np.int8)
+        codes[:, :count] = chunk.T
+        codes = codes.reshape(NUM_ROWS, NUM_COLS, -1)
+        not_cannons = _pack(codes & TYPE_MASK != CANNON)
+        empty = _pack(codes == 0)
+        screens = ~empty & not_cannons
+        for color_bit, result in ((BLUE_BIT, blue), (0, red)):
+            attacked = _side_attacks(codes, color_bit, empty, screens, not_cannons)
+            bits = np.unpackbits(attacked.view(np.uint8), axis=2, count=count, bitorder="little")
+            result[start:start + count] = bits.reshape(NUM_SQUARES, count).T
+    return blue, red
+
+
+def evaluate_batch(boards, mobility_weight=5, palace_weight=10):
+    """
+    Evaluate a stack of boards, (N, 10, 9) or (N, NUM_SQUARES) piece codes, all at once.
+    Return a dict of (N,) arrays, every score from Blue's point of view:
+      material         the material balance, with the values of JanggiSearch.PIECE_VALUES
+      piece_square     the positional part of JanggiSearch's piece-square scores
+      blue_attacked    the number of squares Blue attacks (see attack_maps), red_attacked the same for Red
+      blue_palace      the number of Red palace squares Blue attacks, red_palace the Blue palace squares Red attacks
+      score            material + piece_square + mobility_weight * attacked difference + palace_weight * palace difference
+    """
+    flat = np.asarray(boards, dtype=np.int8).reshape(-1, NUM_SQUARES)
+    indices = flat.astype(np.intp)
+    material = _MATERIAL[indices].sum(axis=1)
+    piece_square = _PIECE_SQUARE[indices, _SQUARES].sum(axis=1) - material
+    blue, red = attack_maps(flat)
+    blue_attacked = blue.sum(axis=1)
+    red_attacked = red.sum(axis=1)
+    blue_palace = blue[:, _RED_PALACE].sum(axis=1)
+    red_palace = red[:, _BLUE_PALACE].sum(axis=1)
+    score = (material + piece_square + mobility_weight * (blue_attacked - red_attacked)
+             + palace_weight * (blue_palace - red_palace))
+    return {"material": material, "piece_square": piece_square,
+            "blue_attacked": blue_attacked, "red_attacked": red_attacked,
+            "blue_palace": blue_palace, "red_palace": red_palace, "score": score}
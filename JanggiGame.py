@@ -12,38 +12,374 @@
 # Locations on the board will be specified using "algebraic notation",
 # with columns labeled a-i and rows labeled 1-10, with row 1 being the Red side and row 10 the Blue side.
 
+import random
+from collections import OrderedDict
+from operator import itemgetter
+
+# The board is a flat buffer of 90 cells, one byte per square, indexed row by row: square = row * NUM_COLS + col.
+NUM_ROWS = 10
+NUM_COLS = 9
+NUM_SQUARES = NUM_ROWS * NUM_COLS
+
+# A cell holds 0 when it is empty, otherwise a piece code: the low three bits are the piece type
+# (1 + its index in PIECE_TYPES) and BLUE_BIT is set for Blue pieces.
+EMPTY = 0
+BLUE_BIT = 8
+TYPE_MASK = 7
+PIECE_TYPES = "KGEHCAS"     # General, Guard, Elephant, Horse, Chariot, cAnnon, Soldier
+GENERAL, GUARD, ELEPHANT, HORSE, CHARIOT, CANNON, SOLDIER = range(1, len(PIECE_TYPES) + 1)
+
+# algebraic name of every square, and the reverse lookup
+SQUARE_NAMES = [chr(ord('a') + sq % NUM_COLS) + str(sq // NUM_COLS + 1) for sq in range(NUM_SQUARES)]
+_SQUARE_INDEX = {name: sq for sq, name in enumerate(SQUARE_NAMES)}
+
+# Zobrist keys: one random 64-bit number per piece code and square, and one for Red to move.
+# The key of a position is the XOR of the numbers of its pieces, so a move updates it with two or three XORs.
+_zobrist_random = random.Random(0x4A414E47)
+_ZOBRIST = [[_zobrist_random.getrandbits(64) if code & TYPE_MASK else 0 for _ in range(NUM_SQUARES)]
+            for code in range(2 * BLUE_BIT)]
+_ZOBRIST_RED_TO_MOVE = _zobrist_random.getrandbits(64)
+del _zobrist_random
+
+# Position notation. The text form lists the rows from row 1 (Red side) to row 10, separated by "/", each row from
+# column a to i: a piece letter of PIECE_TYPES, upper case for Blue and lower case for Red, or a digit counting empty
+# squares. Then come the player to move ("b" or "r"), the game state and the turn number, e.g. the starting layout
+# "cehg1gehc/4k4/1a5a1/s1s1s1s1s/9/9/S1S1S1S1S/1A5A1/4K4/CEHG1GEHC b UNFINISHED 0".
+# The binary form is POSITION_BYTES long: a 96-bit little-endian bitmap with bit sq set for every occupied square,
+# bit 90 set when Red is to move and bits 91-92 holding the index of the game state in GAME_STATES, then the codes
+# of the pieces in square order, two per byte, low nibble first. It keeps the player to move, not the turn number.
+GAME_STATES = ("UNFINISHED", "RED_WON", "BLUE_WON", "DRAW")
+MAX_PIECES = 32
+POSITION_BYTES = 12 + MAX_PIECES // 2
+_RED_TO_MOVE_BIT = NUM_SQUARES
+_STATE_SHIFT = NUM_SQUARES + 1
+
+
 class JanggiGame(object):
     """
     Represents a JanggiGame wth a board, two players:Red and Blue,
-    current_state: "UNFINISHED", "RED_WON", "BLUE_WON" and multiple game's rule functions.
+    current_state: "UNFINISHED", "RED_WON", "BLUE_WON", "DRAW" and multiple game's rule functions.
     """
 
-    def __init__(self):
+    def __init__(self, observers=(), max_moves=None, max_repetitions=None):
         """
         Constructor for JanggiGame.
         There are multiple variables in initial: board, current_state, player,
         place_pieces function and other inital variables if necessary.
+        observers are called after every move made with make_move, see add_observer.
+        max_moves and max_repetitions are the draw limits, none by default, see set_draw_limits.
         """
-        self._num_rows = 10
-        self._num_cols = 9
-        self._board = [[None] * self._num_cols for _ in range(self._num_rows)]
-        self._current_state = "UNFINISHED"             # 'UNFINISHED' or 'RED_WON' or 'BLUE_WON'
+        self._num_rows = NUM_ROWS
+        self._num_cols = NUM_COLS
+        self._board = bytearray(NUM_SQUARES)           # piece codes, see PIECE_TYPES and BLUE_BIT
+        self._current_state = "UNFINISHED"             # 'UNFINISHED' or 'RED_WON' or 'BLUE_WON' or 'DRAW'
         self._players = ["B", "R"]                     # turn is even/odd, player is B/R
         self._turn = 0
         self._full_color_to_color = {"blue": "B", "red": "R"}
+        self._piece_squares = {"B": set(), "R": set()}  # squares of each player's pieces
+        self._king_squares = {}                        # square of each player's General
+        self._zobrist_key = 0                          # Zobrist key of the position and the player to move
+        self._position_counts = {}                     # Zobrist key -> times reached, for the positions of the game
+        self._max_moves = max_moves                    # turn number at which the game is drawn, None for no limit
+        self._max_repetitions = max_repetitions        # times a position may be reached before a draw, None for no limit
+        self._undo_stack = []                          # (from, to, captured code, game state) of each pushed move
+        self._observers = list(observers)              # called after every move made with make_move
+        self._move_cache = None                        # MoveCache used by the move generator, if any
+        self._occupancy = [0] * NUM_LINES              # occupancy bits of every line, see get_occupancy
         self._place_pieces()
 
+    def copy(self):
+        """Return an independent copy of the game, without observers. The position itself is copied as a single buffer."""
+        game = JanggiGame.__new__(JanggiGame)
+        game.__dict__.update(self.__dict__)
+        game._board = bytearray(self._board)
+        game._piece_squares = {color: set(squares) for color, squares in self._piece_squares.items()}
+        game._king_squares = dict(self._king_squares)
+        game._occupancy = list(self._occupancy)
+        game._undo_stack = list(self._undo_stack)
+        game._position_counts = dict(self._position_counts)
+        game._observers = []
+        return game
+
+    def __getstate__(self):
+        """
+        Pickle only the position: the board buffer, the turn and the game state, about a hundred bytes,
+        and the draw limits. The undo stack, the position history and the observers are not pickled;
+        the piece lists and the Zobrist key are rebuilt.
+        """
+        return bytes(self._board), self._turn, self._current_state, self._max_moves, self._max_repetitions
+
+    def __setstate__(self, state):
+        """Restore a game pickled by __getstate__."""
+        self.__init__()
+        board, self._turn, self._current_state, self._max_moves, self._max_repetitions = state
+        self._board = bytearray(board)
+        self._index_pieces()
+
+    @staticmethod
+    def _from_position(board, turn, state):
+        """Get a new game at a position given by a board buffer, the turn and the game state."""
+        game = JanggiGame()
+        game._board = bytearray(board)
+        game._turn = turn
+        game._current_state = state
+        game._index_pieces()
+        return game
+
+    def to_fen(self):
+        """Get the position in text notation, see the description above GAME_STATES."""
+        rows = []
+        for row in range(self._num_rows):
+            text = ""
+            empty = 0
+            for code in self._board[row * self._num_cols:(row + 1) * self._num_cols]:
+                if not code:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                letter = PIECE_TYPES[(code & TYPE_MASK) - 1]
+                text += letter if code & BLUE_BIT else letter.lower()
+            rows.append(text + (str(empty) if empty else ""))
+        return "%s %s %s %d" % ("/".join(rows), "b" if self._turn % 2 == 0 else "r", self._current_state, self._turn)
+
+    @staticmethod
+    def from_fen(text):
+        """
+        Get a new game at the position given in text notation. The game state and the turn number can be left out.
+        Raise ValueError if the text is not a valid position: ten rows of nine squares with one General per player,
+        and a turn number that is the player's to move, even for Blue and odd for Red.
+        """
+        fields = text.split()
+        if not 2 <= len(fields) <= 4:
+            raise ValueError("expected placement, player, state and turn: %r" % text)
+        rows = fields[0].split("/")
+        if len(rows) != NUM_ROWS:
+            raise ValueError("expected %d rows: %r" % (NUM_ROWS, fields[0]))
+        board = bytearray()
+        for row in rows:
+            start = len(board)
+            for char in row:
+                if char.isdigit():
+                    board.extend(bytes(int(char)))
+                elif char.upper() in PIECE_TYPES:
+                    board.append((PIECE_TYPES.index(char.upper()) + 1) | (BLUE_BIT if char.isupper() else 0))
+                else:
+                    raise ValueError("unknown piece %r" % char)
+            if len(board) - start != NUM_COLS:
+                raise ValueError("expected %d squares in row %r" % (NUM_COLS, row))
+        if fields[1] not in ("b", "r"):
+            raise ValueError("expected the player to move, b or r: %r" % fields[1])
+        state = fields[2] if len(fields) > 2 else "UNFINISHED"
+        if state not in GAME_STATES:
+            raise ValueError("unknown game state %r" % state)
+        red_to_move = fields[1] == "r"
+        if len(fields) < 4:
+            turn = int(red_to_move)
+        elif not fields[3].isdigit():
+            raise ValueError("expected a turn number: %r" % fields[3])
+        else:
+            turn = int(fields[3])
+            # Blue moves on even turns, Red on odd ones
+            if turn % 2 != red_to_move:
+                raise ValueError("turn %d is not %s's turn" % (turn, "Red" if red_to_move else "Blue"))
+        return JanggiGame._check_position(JanggiGame._from_position(board, turn, state))
+
+    def to_bytes(self):
+        """Get the position in the POSITION_BYTES long binary form, see the description above GAME_STATES."""
+        occupied = 0
+        nibbles = 0
+        shift = 0
+        for square, code in enumerate(self._board):
+            if code:
+                occupied |= 1 << square
+                nibbles |= code << shift
+                shift += 4
+        if shift > 4 * MAX_PIECES:
+            raise ValueError("more than %d pieces on the board" % MAX_PIECES)
+        occupied |= (self._turn % 2) << _RED_TO_MOVE_BIT | GAME_STATES.index(self._current_state) << _STATE_SHIFT
+        return occupied.to_bytes(12, "little") + nibbles.to_bytes(MAX_PIECES // 2, "little")
+
+    @staticmethod
+    def from_bytes(data):
+        """Get a new game at the position given in binary form. Raise ValueError if it is not a valid position."""
+        if len(data) != POSITION_BYTES:
+            raise ValueError("expected %d bytes, got %d" % (POSITION_BYTES, len(data)))
+        occupied = int.from_bytes(data[:12], "little")
+        nibbles = int.from_bytes(data[12:], "little")
+        board = bytearray(NUM_SQUARES)
+        square_bits = occupied & ((1 << NUM_SQUARES) - 1)
+        while square_bits:
+            low_bit = square_bits & -square_bits
+            board[low_bit.bit_length() - 1] = nibbles & 15
+            nibbles >>= 4
+            square_bits ^= low_bit
+        state = occupied >> _STATE_SHIFT & 3
+        if state >= len(GAME_STATES):
+            raise ValueError("unknown game state %d" % state)
+        turn = occupied >> _RED_TO_MOVE_BIT & 1
+        return JanggiGame._check_position(JanggiGame._from_position(board, turn, GAME_STATES[state]))
+
+    @staticmethod
+    def _check_position(game):
+        """Return game if every square holds a piece code and each player has one General, raise ValueError otherwise."""
+        if any(code and not PIECES[code] for code in game._board):
+            raise ValueError("unknown piece code")
+        for color in game._players:
+            if game._board.count(get_piece(color, "K").get_code()) != 1:
+                raise ValueError("expected one General for %s" % color)
+        return game
+
+    def add_observer(self, observer):
+        """
+        Add an observer, called as observer(game, move_from, move_to, captured) after every move made with make_move.
+        captured is the captured piece, None if there is none; a pass has move_from equal to move_to.
+        Printing, logging or streaming the game are observers, so a game without observers does no I/O.
+        """
+        self._observers.append(observer)
+
+    def remove_observer(self, observer):
+        """Remove an observer added with add_observer or the constructor."""
+        self._observers.remove(observer)
+
+    def set_move_cache(self, cache):
+        """Use a MoveCache for move generation and check tests, or None for no cache. Copies share the cache."""
+        self._move_cache = cache
+
+    def get_move_cache(self):
+        """Get the MoveCache in use, None if there is none"""
+        return self._move_cache
+
+    def _notify(self, move_from, move_to):
+        """Tell every observer about the move just made."""
+        captured = PIECES[self._undo_stack[-1][2]]
+        for observer in self._observers:
+            observer(self, move_from, move_to, captured)
+
     @staticmethod
     def _get_board_position(position):
-        """Get the position and transfer it to the real row and column of the board."""
-        return int(position[1:]) - 1, ord(position[0]) - ord('a')
+        """Get the position and transfer it to the square index of the board, None if it is not on the board."""
+        return _SQUARE_INDEX.get(position)
 
     def _get_king_position(self, color):
         """Get the position of the king and used function in the is_check method"""
-        for i, row in enumerate(self._board):
-            for j, piece in enumerate(row):
-                if piece and piece.get_color() == color and piece.get_name() == "K":
-                    return (i, j)
+        return self._king_squares[color]
+
+    def _index_pieces(self):
+        """
+        Build the piece lists, the General squares, the line occupancy and the Zobrist key from the board.
+        The position history starts over from this position.
+        """
+        self._occupancy = get_occupancy(self._board)
+        self._piece_squares = {"B": set(), "R": set()}
+        self._king_squares = {}
+        self._zobrist_key = _ZOBRIST_RED_TO_MOVE if self._turn % 2 else 0
+        for square, code in enumerate(self._board):
+            if code:
+                color = PIECES[code].get_color()
+                self._piece_squares[color].add(square)
+                self._zobrist_key ^= _ZOBRIST[code][square]
+                if code & TYPE_MASK == GENERAL:
+                    self._king_squares[color] = square
+        self._position_counts = {self._zobrist_key: 1}
+
+    def get_zobrist_key(self):
+        """Get the 64-bit Zobrist key of the position: the pieces, their squares and the player to move."""
+        return self._zobrist_key
+
+    def get_occupancy(self):
+        """Get the occupancy bits of every line of the board, kept up to date by every move, see get_occupancy."""
+        return self._occupancy
+
+    def _move_piece(self, from_pos, to_pos):
+        """
+        Move a piece on the board, in the piece lists and in the line occupancy.
+        Return the code of the captured piece, EMPTY if none.
+        """
+        board = self._board
+        code = board[from_pos]
+        captured = board[to_pos]
+        board[to_pos] = code
+        board[from_pos] = EMPTY
+        occupancy = self._occupancy
+        for line, bit in _SQUARE_LINES[from_pos]:
+            occupancy[line] ^= bit
+        if not captured:
+            for line, bit in _SQUARE_LINES[to_pos]:
+                occupancy[line] ^= bit
+        color = PIECES[code].get_color()
+        squares = self._piece_squares[color]
+        squares.remove(from_pos)
+        squares.add(to_pos)
+        keys = _ZOBRIST[code]
+        self._zobrist_key ^= keys[from_pos] ^ keys[to_pos] ^ _ZOBRIST[captured][to_pos]
+        if captured:
+            self._piece_squares[PIECES[captured].get_color()].remove(to_pos)
+        if code & TYPE_MASK == GENERAL:
+            self._king_squares[color] = to_pos
+        return captured
+
+    def _unmove_piece(self, from_pos, to_pos, captured):
+        """Take back a move made by _move_piece, putting the captured piece back on to_pos."""
+        board = self._board
+        code = board[to_pos]
+        board[from_pos] = code
+        board[to_pos] = captured
+        occupancy = self._occupancy
+        for line, bit in _SQUARE_LINES[from_pos]:
+            occupancy[line] ^= bit
+        if not captured:
+            for line, bit in _SQUARE_LINES[to_pos]:
+                occupancy[line] ^= bit
+        color = PIECES[code].get_color()
+        squares = self._piece_squares[color]
+        squares.remove(to_pos)
+        squares.add(from_pos)
+        keys = _ZOBRIST[code]
+        self._zobrist_key ^= keys[from_pos] ^ keys[to_pos] ^ _ZOBRIST[captured][to_pos]
+        if captured:
+            self._piece_squares[PIECES[captured].get_color()].add(to_pos)
+        if code & TYPE_MASK == GENERAL:
+            self._king_squares[color] = from_pos
+
+    def push(self, move):
+        """
+        Make a move without validating it and without printing, so search code can explore positions in place.
+        The move is a (from square, to square) pair of board indices, and the same square twice is a pass.
+        The captured piece, the game state and the move are kept on the undo stack for pop,
+        and the new position is counted in the position history.
+        """
+        from_pos, to_pos = move
+        captured = EMPTY
+        if from_pos != to_pos:
+            captured = self._move_piece(from_pos, to_pos)
+        self._undo_stack.append((from_pos, to_pos, captured, self._current_state))
+        self._update_turn()
+        counts = self._position_counts
+        counts[self._zobrist_key] = counts.get(self._zobrist_key, 0) + 1
+
+    def pop(self):
+        """Take back the last move made with push or make_move, and return it as a (from square, to square) pair."""
+        from_pos, to_pos, captured, self._current_state = self._undo_stack.pop()
+        counts = self._position_counts
+        if counts[self._zobrist_key] == 1:
+            del counts[self._zobrist_key]
+        else:
+            counts[self._zobrist_key] -= 1
+        if from_pos != to_pos:
+            self._unmove_piece(from_pos, to_pos, captured)
+        self._turn -= 1
+        self._zobrist_key ^= _ZOBRIST_RED_TO_MOVE
+        return from_pos, to_pos
+
+    def get_board(self):
+        """Get the board buffer: one piece code per square index, see PIECES. It must not be changed directly."""
+        return self._board
+
+    def get_player(self):
+        """Get the player to move, 'blue' or 'red'."""
+        return "blue" if self._turn % 2 == 0 else "red"
 
     def _get_player(self):
         """Get player"""
@@ -53,80 +389,226 @@ class JanggiGame(object):
         """Get opponent"""
         return self._players[(self._turn+1) % 2]
 
-    def _is_valid_move(self, move_from, move_to):
+    def _is_valid_move(self, from_pos, to_pos):
         """Check if it is a valid move."""
-        from_row, from_col = self._get_board_position(move_from)
-        to_row, to_col = self._get_board_position(move_to)
-        piece_from = self._board[from_row][from_col]
-        piece_to = self._board[to_row][to_col]
+        piece_from = PIECES[self._board[from_pos]]
+        piece_to = PIECES[self._board[to_pos]]
         # if from and to are the same color, cannot move
         if piece_from and piece_to and piece_from.get_color() == piece_to.get_color(): return False
         # check if move_to is in the valid moves of the from piece
-        return (to_row, to_col) in piece_from.get_valid_moves((from_row, from_col))
+        return to_pos in piece_from.get_valid_moves(self._board, from_pos, self._occupancy)
 
     def _place_pieces(self):
         """Place all pieces to initialize the board."""
-        init_position_to_piece = {'a1': Chariots("R", "C", self._board),
-                                  'b1': Elephants("R", "E", self._board),
-                                  'c1': Horses("R", "H", self._board),
-                                  'd1': Guards("R", "G", self._board),
-                                  'f1': Guards("R", "G", self._board),
-                                  'g1': Elephants("R", "E", self._board),
-                                  'h1': Horses("R", "H", self._board),
-                                  'i1': Chariots("R", "C", self._board),
-                                  'e2': General("R", "K", self._board),
-                                  'b3': Cannons("R", "A", self._board),
-                                  'h3': Cannons("R", "A", self._board),
-                                  'a4': Soldiers("R", "S", self._board),
-                                  'c4': Soldiers("R", "S", self._board),
-                                  'e4': Soldiers("R", "S", self._board),
-                                  'g4': Soldiers("R", "S", self._board),
-                                  'i4': Soldiers("R", "S", self._board),
-                                  'a10': Chariots("B", "C", self._board),
-                                  'b10': Elephants("B", "E", self._board),
-                                  'c10': Horses("B", "H", self._board),
-                                  'd10': Guards("B", "G", self._board),
-                                  'f10': Guards("B", "G", self._board),
-                                  'g10': Elephants("B", "E", self._board),
-                                  'h10': Horses("B", "H", self._board),
-                                  'i10': Chariots("B", "C", self._board),
-                                  'e9': General("B", "K", self._board),
-                                  'b8': Cannons("B", "A", self._board),
-                                  'h8': Cannons("B", "A", self._board),
-                                  'a7': Soldiers("B", "S", self._board),
-                                  'c7': Soldiers("B", "S", self._board),
-                                  'e7': Soldiers("B", "S", self._board),
-                                  'g7': Soldiers("B", "S", self._board),
-                                  'i7': Soldiers("B", "S", self._board),
+        init_position_to_piece = {'a1': get_piece("R", "C"),
+                                  'b1': get_piece("R", "E"),
+                                  'c1': get_piece("R", "H"),
+                                  'd1': get_piece("R", "G"),
+                                  'f1': get_piece("R", "G"),
+                                  'g1': get_piece("R", "E"),
+                                  'h1': get_piece("R", "H"),
+                                  'i1': get_piece("R", "C"),
+                                  'e2': get_piece("R", "K"),
+                                  'b3': get_piece("R", "A"),
+                                  'h3': get_piece("R", "A"),
+                                  'a4': get_piece("R", "S"),
+                                  'c4': get_piece("R", "S"),
+                                  'e4': get_piece("R", "S"),
+                                  'g4': get_piece("R", "S"),
+                                  'i4': get_piece("R", "S"),
+                                  'a10': get_piece("B", "C"),
+                                  'b10': get_piece("B", "E"),
+                                  'c10': get_piece("B", "H"),
+                                  'd10': get_piece("B", "G"),
+                                  'f10': get_piece("B", "G"),
+                                  'g10': get_piece("B", "E"),
+                                  'h10': get_piece("B", "H"),
+                                  'i10': get_piece("B", "C"),
+                                  'e9': get_piece("B", "K"),
+                                  'b8': get_piece("B", "A"),
+                                  'h8': get_piece("B", "A"),
+                                  'a7': get_piece("B", "S"),
+                                  'c7': get_piece("B", "S"),
+                                  'e7': get_piece("B", "S"),
+                                  'g7': get_piece("B", "S"),
+                                  'i7': get_piece("B", "S"),
                                   }
 
         for position in init_position_to_piece:
-            row, col = self._get_board_position(position)
-            self._board[row][col] = init_position_to_piece[position]
+            self._board[self._get_board_position(position)] = init_position_to_piece[position].get_code()
+        self._index_pieces()
 
     def _update_turn(self):
         """Update turn"""
         self._turn += 1
+        self._zobrist_key ^= _ZOBRIST_RED_TO_MOVE
 
-    def _print_board(self):
+    def print_board(self):
         """Print board"""
-        for row in self._board:
-            line = [piece if piece else " " for piece in row]
+        for row in range(self._num_rows):
+            cells = self._board[row * self._num_cols:(row + 1) * self._num_cols]
+            line = [PIECES[code] if code else " " for code in cells]
             print(line)
         print("=" * 50)
 
     def is_in_check(self, color):
         """Check if it is in check."""
         color = self._full_color_to_color[color]
-        row_id, col_id = pos = self._get_king_position(color)
-        king = self._board[row_id][col_id]
-        can_be_captured = king.can_be_captured(pos)
+        pos = self._get_king_position(color)
+        if self._move_cache is not None:
+            return self._move_cache.can_be_captured(self._board, pos, self._occupancy)
+        king = PIECES[self._board[pos]]
+        can_be_captured = king.can_be_captured(self._board, pos, self._occupancy)
         return can_be_captured
 
+    def _generate_legal_moves(self, color, captures=True, quiet=True, passes=True):
+        """
+        Yield the legal moves of color ("B" or "R") as (from square, to square) pairs, lazily and in stages:
+        the captures, then the quiet moves, then the pass, each stage only if asked for.
+        A move is legal when it does not put or leave the General in check. The General's own moves are
+        already checked by General.get_valid_moves; any other move is tried on the board and taken back.
+        That test is the costly part, so the moves generated while looking for captures are only set aside,
+        and their quiet moves tested when the quiet stage is reached: a caller that stops early does not pay for them.
+        Moves and check tests go through the move cache if there is one. A move tried on the board is tried in the
+        line occupancy too, by flipping the bits of the squares it empties and fills.
+        The game must be at the same position whenever the generator is resumed.
+        """
+        board = self._board
+        occupancy = self._occupancy
+        king_pos = self._king_squares[color]
+        cache = self._move_cache
+        is_attacked = cache.can_be_captured if cache is not None else PIECES[board[king_pos]].can_be_captured
+        get_moves = cache.get_valid_moves if cache is not None else None
+        generated = []
+        for pos in tuple(self._piece_squares[color]):
+            code = board[pos]
+            if get_moves is not None:
+                moves = get_moves(board, pos, occupancy)
+            else:
+                moves = PIECES[code].get_valid_moves(board, pos, occupancy)
+            if quiet:
+                generated.append((pos, code, moves))
+            if not captures:
+                continue
+            for to_pos in moves:
+                captured = board[to_pos]
+                if not captured:
+                    continue
+                if pos == king_pos:
+                    yield pos, to_pos
+                    continue
+                board[to_pos] = code
+                board[pos] = EMPTY
+                pos_lines = _SQUARE_LINES[pos]
+                for line, bit in pos_lines:
+                    occupancy[line] ^= bit
+                in_check = is_attacked(board, king_pos, occupancy)
+                for line, bit in pos_lines:
+                    occupancy[line] ^= bit
+                board[pos] = code
+                board[to_pos] = captured
+                if not in_check:
+                    yield pos, to_pos
+        for pos, code, moves in generated:
+            for to_pos in moves:
+                if board[to_pos]:
+                    continue
+                if pos == king_pos:
+                    yield pos, to_pos
+                    continue
+                board[to_pos] = code
+                board[pos] = EMPTY
+                pos_lines = _SQUARE_LINES[pos]
+                to_lines = _SQUARE_LINES[to_pos]
+                for line, bit in pos_lines:
+                    occupancy[line] ^= bit
+                for line, bit in to_lines:
+                    occupancy[line] ^= bit
+                in_check = is_attacked(board, king_pos, occupancy)
+                for line, bit in pos_lines:
+                    occupancy[line] ^= bit
+                for line, bit in to_lines:
+                    occupancy[line] ^= bit
+                board[pos] = code
+                board[to_pos] = EMPTY
+                if not in_check:
+                    yield pos, to_pos
+        # a player can pass unless it would leave the General in check
+        if passes and not is_attacked(board, king_pos, occupancy):
+            yield king_pos, king_pos
+
+    def iter_legal_moves(self, color, captures=True, quiet=True, passes=True):
+        """
+        Yield the legal moves of 'red' or 'blue' lazily, the captures first, then the quiet moves, then the pass;
+        captures, quiet and passes choose the stages. See _generate_legal_moves.
+        """
+        return self._generate_legal_moves(self._full_color_to_color[color], captures, quiet, passes)
+
+    def attacks(self, square, color):
+        """
+        Check if a piece of 'red' or 'blue' attacks square, given by its algebraic name or its index: whether it could
+        capture an opposing piece standing there, whether or not that move would leave its own General in check.
+        Only the squares an attacker could come from are looked at, and the search stops at the first attacker.
+        Raise ValueError for a square off the board or a color other than 'red' and 'blue'.
+        """
+        if isinstance(square, int) and not isinstance(square, bool):
+            pos = square if 0 <= square < NUM_SQUARES else None
+        else:
+            pos = self._get_board_position(square)
+        if pos is None:
+            raise ValueError("unknown square %r" % (square,))
+        if color not in self._full_color_to_color:
+            raise ValueError("color must be 'red' or 'blue': %r" % (color,))
+        return _is_attacked_by(self._board, pos, BLUE_BIT if color == "blue" else 0,
+                               self._board[pos] & TYPE_MASK == CANNON, self._occupancy)
+
+    def legal_moves(self, color):
+        """
+        Get all legal moves of 'red' or 'blue', the pass included, as (from square, to square) pairs of board indices,
+        the captures first. SQUARE_NAMES gives the algebraic name of a square. A pass is the General's square twice.
+        """
+        return list(self._generate_legal_moves(self._full_color_to_color[color]))
+
+    def _is_checkmate(self, color):
+        """Check if color ("B" or "R") is checkmated: in check, with no legal move to escape."""
+        king_pos = self._king_squares[color]
+        if self._move_cache is not None:
+            in_check = self._move_cache.can_be_captured(self._board, king_pos, self._occupancy)
+        else:
+            in_check = PIECES[self._board[king_pos]].can_be_captured(self._board, king_pos, self._occupancy)
+        if not in_check:
+            return False
+        # stop at the first legal move
+        for _ in self._generate_legal_moves(color):
+            return False
+        return True
+
+    def is_checkmate(self, color):
+        """Check if 'red' or 'blue' is checkmated. Blocking or capturing the checking piece counts as an escape."""
+        return self._is_checkmate(self._full_color_to_color[color])
+
     def get_game_state(self):
         """Get game state."""
         return self._current_state
 
+    def set_draw_limits(self, max_moves=None, max_repetitions=None):
+        """
+        Set the draw limits, None for no limit. The game is drawn after a move made with make_move or play
+        when the turn number (the number of moves from the start, passes included) reaches max_moves,
+        or when the position, with the same player to move, has been reached max_repetitions times.
+        A checkmate on the same move wins rather than draws.
+        """
+        self._max_moves = max_moves
+        self._max_repetitions = max_repetitions
+
+    def get_draw_limits(self):
+        """Get the draw limits as (max_moves, max_repetitions)"""
+        return self._max_moves, self._max_repetitions
+
+    def get_repetition_count(self):
+        """Get the number of times the current position, with the same player to move, has been reached in the game."""
+        return self._position_counts.get(self._zobrist_key, 0)
+
     def make_move(self, move_from, move_to):
         """
         Get move_from and move_to parameters from user and make move. This is the public function.
@@ -141,109 +623,260 @@ class JanggiGame(object):
             boolean: Return True or False. If it goes through all checks, then it returns True, otherwise it returns False.
         """
 
+        # get board position, squares off the board are invalid
+        pos = self._get_board_position(move_from)
+        to_pos = self._get_board_position(move_to)
+        if pos is None or to_pos is None:
+            return False
+        return self.play((pos, to_pos))
+
+    def _check_draw(self):
+        """Draw the game if the move just made reached a draw limit, see set_draw_limits."""
+        if self._max_moves is not None and self._turn >= self._max_moves:
+            self._current_state = "DRAW"
+        elif self._max_repetitions is not None and \
+                self._position_counts[self._zobrist_key] >= self._max_repetitions:
+            self._current_state = "DRAW"
+
+    def play(self, move):
+        """
+        Make a move given as a (from square, to square) pair of board indices, the same square twice for a pass.
+        It is make_move without the parsing of the algebraic notation: the move is validated, the game state is
+        updated and the observers are told. Return True if the move was made, False if it is not legal.
+        """
         # check game state, if the game has finished, return False
-        game_state = self.get_game_state()
-        if game_state == 'RED_WON' or game_state == 'BLUE_WON':
+        if self.get_game_state() != 'UNFINISHED':
             return False
 
-        # get board position
-        from_row, from_col = pos = self._get_board_position(move_from)
-        to_row, to_col = self._get_board_position(move_to)
-        piece = self._board[from_row][from_col]
+        pos, to_pos = move
+        piece = PIECES[self._board[pos]]
         # if piece is empty, move is invalid
         if not piece:
             return False
 
         # if it's not the right player
-        if self._get_player() != piece.get_color():
+        player = self._get_player()
+        if player != piece.get_color():
             return False
 
+        king_pos = self._get_king_position(player)
+        king = PIECES[self._board[king_pos]]
         # pass the turn
-        if move_from == move_to:
-            # It's General and is_in_check, cannot pass
-            if piece.get_name() == "K" and piece.can_be_captured(pos):
+        if pos == to_pos:
+            # the General is in check, cannot pass
+            if king.can_be_captured(self._board, king_pos, self._occupancy):
                 return False
-            self._update_turn()
+            self.push(move)
+            self._check_draw()
+            if self._observers:
+                self._notify(SQUARE_NAMES[pos], SQUARE_NAMES[to_pos])
             return True
 
         # not valid move
-        if not self._is_valid_move(move_from, move_to):
+        if not self._is_valid_move(pos, to_pos):
             return False
 
-        self._board[to_row][to_col] = self._board[from_row][from_col]
-        self._board[from_row][from_col] = None
-
-        opponent_pos = self._get_king_position(self._get_opponent())
-        opponent_king = self._board[opponent_pos[0]][opponent_pos[1]]
-        # If opponent is in check and the opponent's king cannot move, it's checkmate
-        if opponent_king.can_be_captured(opponent_pos):
-            valid_moves = []
-            for next_pos in opponent_king.get_valid_moves(opponent_pos):
-                tmp_piece = self._board[next_pos[0]][next_pos[1]]
-                self._board[next_pos[0]][next_pos[1]] = opponent_king
-                self._board[opponent_pos[0]][opponent_pos[1]] = None
-                if not opponent_king.can_be_captured(next_pos):
-                    valid_moves.append(next_pos)
-                self._board[next_pos[0]][next_pos[1]] = tmp_piece
-                self._board[opponent_pos[0]][opponent_pos[1]] = opponent_king
-
-            if len(valid_moves) == 0:
-                self._current_state = "BLUE_WON" if self._get_player() == "B" else "RED_WON"
-
-        self._print_board()
-        self._update_turn()
+        self.push(move)
+        # cannot put or leave the General in check
+        king_pos = self._get_king_position(player)
+        if king.can_be_captured(self._board, king_pos, self._occupancy):
+            self.pop()
+            return False
+
+        # the move is pushed, so the opponent is now the player to move
+        if self._is_checkmate(self._get_player()):
+            self._current_state = "BLUE_WON" if player == "B" else "RED_WON"
+        else:
+            self._check_draw()
+
+        if self._observers:
+            self._notify(SQUARE_NAMES[pos], SQUARE_NAMES[to_pos])
         return True
 
 
-class Piece():
+# Occupancy bitboards of the lines chariots and cannons move along: the ten rows, the nine columns and the four
+# palace diagonals. The occupancy of a line is an int with bit k set when its k-th square holds a piece, and a game
+# keeps the occupancy of every line up to date as pieces move, with one XOR per line through a square.
+# For every square and every line through it, a table indexed by the occupancy of the line gives the entry of that
+# square along the line: the empty squares up to the first piece in each direction, and for each direction with a
+# piece the first piece, the empty squares after it and the second piece. A chariot moves to the empty squares and
+# captures a first piece of the other color; a cannon jumps a first piece that is not a cannon, onto the empty squares
+# after it or onto a second piece of the other color that is not a cannon; and a square is attacked along the line by
+# an opponent chariot as first piece, or an opponent cannon as second piece behind a screen that is not a cannon.
+# Only the colors and types of the end squares are read from the board, so a line costs one lookup whatever its length.
+# The tables are built once at import; entries are shared between occupancies that give the same one.
+_LINES = ([tuple(range(row * NUM_COLS, (row + 1) * NUM_COLS)) for row in range(NUM_ROWS)] +
+          [tuple(range(col, NUM_SQUARES, NUM_COLS)) for col in range(NUM_COLS)] +
+          [tuple(row * NUM_COLS + col for row, col in diagonal) for top in (0, NUM_ROWS - 3)
+           for diagonal in (((top, 3), (top + 1, 4), (top + 2, 5)), ((top, 5), (top + 1, 4), (top + 2, 3)))])
+NUM_LINES = len(_LINES)
+# (square, bit) of every square of each line
+_LINE_BITS = [tuple((sq, 1 << k) for k, sq in enumerate(squares)) for squares in _LINES]
+# (line, bit) of every line through each square
+_SQUARE_LINES = [tuple((line, 1 << squares.index(sq)) for line, squares in enumerate(_LINES) if sq in squares)
+                 for sq in range(NUM_SQUARES)]
+
+
+def _read_line(board, line):
+    """Get the occupancy of a line from the board buffer."""
+    bits = 0
+    for sq, bit in _LINE_BITS[line]:
+        if board[sq]:
+            bits |= bit
+    return bits
+
+
+def get_occupancy(board):
+    """
+    Get the occupancy of every line of a board buffer, as a list indexed by line: bit k of a line's int is set
+    when its k-th square holds a piece. Pass it to the move generators and check tests to spare them reading it.
+    """
+    return [_read_line(board, line) for line in range(NUM_LINES)]
+
+
+def _scan_line(length, index, bits):
+    """
+    Get the entry of position index on a line of length squares with occupancy bits, in positions along the line:
+    (empty positions up to the first piece both ways, ((first piece, empty positions after it, second piece or -1),
+    one per direction with a piece)).
+    """
+    empty = []
+    directions = []
+    for step in (-1, 1):
+        k = index + step
+        while 0 <= k < length and not bits >> k & 1:
+            empty.append(k)
+            k += step
+        if not 0 <= k < length:
+            continue
+        first = k
+        after = []
+        k += step
+        while 0 <= k < length and not bits >> k & 1:
+            after.append(k)
+            k += step
+        directions.append((first, tuple(after), k if 0 <= k < length else -1))
+    return tuple(empty), tuple(directions)
+
+
+def _build_slides():
+    """Build, for every square, the (line, table) pairs of the lines through it, see _LINES."""
+    relative = {}
+    for length in {len(squares) for squares in _LINES}:
+        for index in range(length):
+            relative[length, index] = [_scan_line(length, index, bits) for bits in range(1 << length)]
+    slides = [[] for _ in range(NUM_SQUARES)]
+    for line, squares in enumerate(_LINES):
+        for index, sq in enumerate(squares):
+            shared = {}
+            table = []
+            for entry in relative[len(squares), index]:
+                if entry not in shared:
+                    empty, directions = entry
+                    shared[entry] = (tuple(squares[k] for k in empty),
+                                     tuple((squares[first], tuple(squares[k] for k in after),
+                                            squares[second] if second >= 0 else -1)
+                                           for first, after, second in directions))
+                table.append(shared[entry])
+            slides[sq].append((line, table))
+    return [tuple(lines) for lines in slides]
+
+
+_SLIDES = _build_slides()
+
+
+class Piece(object):
     """
     Represents a Piece class with a color and name. This class is the parent class. All the other piece classes are child class.
+    Pieces hold no position and no board: there is one shared instance per color and name (see PIECES),
+    and the move generators read the board buffer they are given.
+    The geometry of every move is fixed, so each piece builds a table once with its moves from every square,
+    and generating moves is a table lookup plus occupancy checks. The reverse table, the squares each square
+    can be reached from, answers whether a square is attacked without generating the opponent's moves.
     """
-    def __init__(self, color, name, board):
+    __slots__ = ("_color", "_name", "_code", "_moves", "_attacks")
+
+    _UP = [(-1, 0)]
+    _DOWN = [(1, 0)]
+    _RIGHT = [(0, 1)]
+    _LEFT = [(0, -1)]
+    _UP_LEFT = [(-1, -1)]
+    _UP_RIGHT = [(-1, 1)]
+    _DOWN_LEFT = [(1, -1)]
+    _DOWN_RIGHT = [(1, 1)]
+
+    # directions anywhere on the board, and extra directions from some palace squares, for each color
+    _BLUE_DIRECTIONS = _RED_DIRECTIONS = []
+    _BLUE_SPECIAL_DIRECTIONS = _RED_SPECIAL_DIRECTIONS = {}
+    _max_step = 1
+    _special_max_step = 1
+
+    def __init__(self, color, name):
         """
-        Constructor for Piece. It have some initial variables: color, name, board, directions and max_step.
+        Constructor for Piece. It have some initial variables: color, name, code and the table of moves.
         """
         self._color = color
         self._name = name
-        self._UP = [(-1, 0)]
-        self._DOWN = [(1, 0)]
-        self._RIGHT = [(0, 1)]
-        self._LEFT = [(0, -1)]
-        self._UP_LEFT = [(-1, -1)]
-        self._UP_RIGHT = [(-1, 1)]
-        self._DOWN_LEFT = [(1, -1)]
-        self._DOWN_RIGHT = [(1, 1)]
-        self._board = board
-        self._directions = []
-        self._special_directions = {}
-        self._max_step = 1
-        self._special_max_step = 1
-        self._num_rows, self._num_cols = len(self._board), len(self._board[0])
+        self._code = (PIECE_TYPES.index(name) + 1) | (BLUE_BIT if color == "B" else 0)
+        if color == "B":
+            self._moves = self._build_moves(self._BLUE_DIRECTIONS, self._BLUE_SPECIAL_DIRECTIONS)
+        else:
+            self._moves = self._build_moves(self._RED_DIRECTIONS, self._RED_SPECIAL_DIRECTIONS)
+        self._attacks = self._build_attacks()
 
     def __repr__(self):
         """A special method used to represent a class’s objects as a string."""
         return self._color + ":" + self._name
 
-    def _is_valid(self, pos, top_left, bottom_right, block_colors):
-        """Check if it is a valid move."""
-        eat_enemy = False
-        # is_valid: if pos is out of range
-        top_row, left_col = top_left
-        bottom_row, right_col = bottom_right
-        if pos[0] < top_row or pos[0] > bottom_row or pos[1] < left_col or pos[1] > right_col:
-            return False, eat_enemy
-        # if it is General, check if it is in check
-        if self._name == "K" and self.can_be_captured(pos):
-            return False, eat_enemy
-
-        piece = self._board[pos[0]][pos[1]]
-        # pos is empty, can be moved
-        if not piece: return True, eat_enemy
-        # if pos is not empty, check if color in block_colors
-        if piece.get_color() in block_colors:
-            return False, eat_enemy
-        eat_enemy = True
-        return True, eat_enemy
+    @staticmethod
+    def _get_palace_bounds(row):
+        """Get the top left and bottom right corner of the palace on the given row's side of the board."""
+        return ((0, 3), (2, 5)) if row < NUM_ROWS // 2 else ((7, 3), (9, 5))
+
+    def _get_rays(self, pos, directions, special_directions):
+        """
+        Get the rays from square pos on an empty board. A ray is the list of (target, blockers) steps in one direction,
+        where blockers are the squares passed over on the way to target that must be empty for the move.
+        """
+        from_row, from_col = divmod(pos, NUM_COLS)
+        full_bounds = ((0, 0), (NUM_ROWS-1, NUM_COLS-1))
+        moves = [(direction, self._max_step, full_bounds) for direction in directions]
+        # special case in square for "K","G","S","C","A"
+        for direction in special_directions.get((from_row, from_col), []):
+            moves.append((direction, self._special_max_step, self._get_palace_bounds(from_row)))
+
+        rays = []
+        for direction, max_step, bounds in moves:
+            (top_row, left_col), (bottom_row, right_col) = bounds
+            row, col = from_row, from_col
+            ray = []
+            for step in range(max_step):
+                path = []
+                for subdir in direction:
+                    row, col = row + subdir[0], col + subdir[1]
+                    if row < top_row or row > bottom_row or col < left_col or col > right_col:
+                        break
+                    path.append(row * NUM_COLS + col)
+                # the whole step must stay in range
+                if len(path) < len(direction):
+                    break
+                ray.append((path[-1], tuple(path[:-1])))
+            if ray:
+                rays.append(ray)
+        return rays
+
+    def _build_moves(self, directions, special_directions):
+        """Build the table of moves: for every square, a tuple of (target, blockers) pairs."""
+        return [tuple(step for ray in self._get_rays(pos, directions, special_directions) for step in ray)
+                for pos in range(NUM_SQUARES)]
+
+    def _build_attacks(self):
+        """Build the reverse table of moves: for every target square, a tuple of (from square, blockers) pairs."""
+        attacks = [[] for _ in range(NUM_SQUARES)]
+        for pos in range(NUM_SQUARES):
+            for target, blockers in self._moves[pos]:
+                attacks[target].append((pos, blockers))
+        return [tuple(sources) for sources in attacks]
 
     def get_color(self):
         """Get color"""
@@ -253,66 +886,45 @@ class Piece():
         """Get name"""
         return self._name
 
-    def get_valid_moves(self, pos):
-        """Get individual piece's all valid moves"""
+    def get_code(self):
+        """Get the code stored for this piece in the board buffer"""
+        return self._code
+
+    def get_empty_board_moves(self, pos):
+        """Get the moves from square pos on an empty board, as (target, squares passed over on the way) pairs"""
+        return self._moves[pos]
+
+    def get_empty_board_sources(self, pos):
+        """Get the moves to square pos on an empty board, as (from square, squares passed over on the way) pairs"""
+        return self._attacks[pos]
+
+    def get_valid_moves(self, board, pos, occupancy=None):
+        """
+        Get individual piece's all valid moves from square pos on the board buffer.
+        occupancy is the line occupancy of the board (see get_occupancy), read from the board when not given;
+        only chariots, cannons and the General use it.
+        """
         valid_moves = []
-        from_row, from_col = pos
-        block_colors = ["R", "B"]
-
-        max_steps = [self._max_step] * len(self._directions)
-        bounds = [((0, 0), (self._num_rows-1, self._num_cols-1))] * len(self._directions)
-        directions = self._directions[:]
-
-        # special case in square for "K","G","S","C"
-        if pos in self._special_directions:
-            directions += self._special_directions[pos]
-            max_steps += [self._special_max_step] * len(self._special_directions)
-            if self._color == "B":
-                bounds += [((7, 3), (9, 5))] * len(self._special_directions)
-            else:
-                bounds += [((0, 3), (2, 5))] * len(self._special_directions)
-
-        # get all valid moves
-        for i, direction in enumerate(directions):
-            is_valid_move, eat_enemy = True, False
-            max_step = max_steps[i]
-            top_left, bottom_right = bounds[i]
-            # iterate direction
-            for step in range(1, max_step+1):
-                for j, subdir in enumerate(direction):
-                    # if i equals to last step, only piece with the same color can block itself
-                    if j == len(direction) - 1:
-                        block_colors = [self._color]
-                    # move_from, move_to add one direction step
-                    pos = (pos[0] + subdir[0], pos[1] + subdir[1])
-                    # check if it is a valid move, if it's not a valid move, return false, then break
-                    is_valid_move, eat_enemy = self._is_valid(pos, top_left, bottom_right, block_colors)
-                    # break action when invalid or eat enemy
-                    if not is_valid_move or eat_enemy:
-                        break
-                # break step when invalid or hit enemy
-                if not is_valid_move:
-                    break
-                # if it is valid move, append position
-                valid_moves.append(pos)
-                # if eat enemy, cannot move further
-                if eat_enemy:
+        color_bit = self._code & BLUE_BIT
+        for target, blockers in self._moves[pos]:
+            # the move is blocked by any piece on the way
+            for square in blockers:
+                if board[square]:
                     break
-            pos = (from_row, from_col)  # reset position
+            else:
+                code = board[target]
+                # only piece with the same color can block the last step
+                if not code or code & BLUE_BIT != color_bit:
+                    valid_moves.append(target)
         return valid_moves
 
-    def can_be_captured(self, pos):
-        """Check if General can be captured. If the General is in opponent's valid moves, the General is in check."""
-        opponent_pieces = []
-        opponent_valid_moves = []
-        opponent_color = "B" if self._color == "R" else "R"
-        for i, row in enumerate(self._board):
-            for j, piece in enumerate(row):
-                if piece and piece.get_color() == opponent_color and piece.get_name() != "K":
-                    opponent_pieces.append(piece)
-                    opponent_valid_moves += piece.get_valid_moves((i, j))
-        opponent_valid_moves = set(opponent_valid_moves)
-        return pos in opponent_valid_moves
+    def can_be_captured(self, board, pos, occupancy=None):
+        """
+        Check if the piece could be captured on square pos. If it is in one of the opponent's valid moves, it can be captured.
+        The piece need not stand on pos, see _is_attacked_by. occupancy is as for get_valid_moves.
+        """
+        return _is_attacked_by(board, pos, self._code & BLUE_BIT ^ BLUE_BIT, self._code & TYPE_MASK == CANNON,
+                               occupancy)
 
 
 class Elephants(Piece):
@@ -321,26 +933,23 @@ class Elephants(Piece):
     It starts one point forward, backward, left or right, and then moves two points outward diagonally.
     It can be blocked anywhere along this path.
     """
+    __slots__ = ()
 
-    def __init__(self, color, name, game):
-        """Constructor for Elephants."""
-        super().__init__(color, name, game)
-
-        # Elephants' move
-        self._UP_UP_LEFT_UP_LEFT = self._UP + self._UP_LEFT + self._UP_LEFT
-        self._UP_UP_RIGHT_UP_RIGHT = self._UP + self._UP_RIGHT + self._UP_RIGHT
-        self._DOWN_DOWN_LEFT_DOWN_LEFT = self._DOWN + self._DOWN_LEFT + self._DOWN_LEFT
-        self._DOWN_DOWN_RIGHT_DOWN_RIGHT = self._DOWN + self._DOWN_RIGHT + self._DOWN_RIGHT
-        self._LEFT_UP_LEFT_UP_LEFT = self._LEFT + self._UP_LEFT + self._UP_LEFT
-        self._LEFT_DOWN_LEFT_DOWN_LEFT = self._LEFT + self._DOWN_LEFT + self._DOWN_LEFT
-        self._RIGHT_UP_RIGHT_UP_RIGHT = self._RIGHT + self._UP_RIGHT + self._UP_RIGHT
-        self._RIGHT_DOWN_RIGHT_DOWN_RIGHT = self._RIGHT + self._DOWN_RIGHT + self._DOWN_RIGHT
+    # Elephants' move
+    _UP_UP_LEFT_UP_LEFT = Piece._UP + Piece._UP_LEFT + Piece._UP_LEFT
+    _UP_UP_RIGHT_UP_RIGHT = Piece._UP + Piece._UP_RIGHT + Piece._UP_RIGHT
+    _DOWN_DOWN_LEFT_DOWN_LEFT = Piece._DOWN + Piece._DOWN_LEFT + Piece._DOWN_LEFT
+    _DOWN_DOWN_RIGHT_DOWN_RIGHT = Piece._DOWN + Piece._DOWN_RIGHT + Piece._DOWN_RIGHT
+    _LEFT_UP_LEFT_UP_LEFT = Piece._LEFT + Piece._UP_LEFT + Piece._UP_LEFT
+    _LEFT_DOWN_LEFT_DOWN_LEFT = Piece._LEFT + Piece._DOWN_LEFT + Piece._DOWN_LEFT
+    _RIGHT_UP_RIGHT_UP_RIGHT = Piece._RIGHT + Piece._UP_RIGHT + Piece._UP_RIGHT
+    _RIGHT_DOWN_RIGHT_DOWN_RIGHT = Piece._RIGHT + Piece._DOWN_RIGHT + Piece._DOWN_RIGHT
 
-        # Elephants' all valid move
-        self._directions = [self._UP_UP_LEFT_UP_LEFT] + [self._UP_UP_RIGHT_UP_RIGHT] + \
-                           [self._DOWN_DOWN_LEFT_DOWN_LEFT] + [self._DOWN_DOWN_RIGHT_DOWN_RIGHT] + \
-                           [self._LEFT_UP_LEFT_UP_LEFT] + [self._LEFT_DOWN_LEFT_DOWN_LEFT] + \
-                           [self._RIGHT_UP_RIGHT_UP_RIGHT] + [self._RIGHT_DOWN_RIGHT_DOWN_RIGHT]
+    # Elephants' all valid move
+    _BLUE_DIRECTIONS = _RED_DIRECTIONS = [_UP_UP_LEFT_UP_LEFT] + [_UP_UP_RIGHT_UP_RIGHT] + \
+                                         [_DOWN_DOWN_LEFT_DOWN_LEFT] + [_DOWN_DOWN_RIGHT_DOWN_RIGHT] + \
+                                         [_LEFT_UP_LEFT_UP_LEFT] + [_LEFT_DOWN_LEFT_DOWN_LEFT] + \
+                                         [_RIGHT_UP_RIGHT_UP_RIGHT] + [_RIGHT_DOWN_RIGHT_DOWN_RIGHT]
 
 
 class Horses(Piece):
@@ -348,26 +957,23 @@ class Horses(Piece):
     Represents a Horses class with a color and name. This class is the child class. Inherits all the methods and properties from Piece class.
     It can move one point forward, backward, left or right plus one point outward diagonally. If it is blocked, it can not move.
     """
+    __slots__ = ()
 
-    def __init__(self, color, name, game):
-        """Constructor for Horses."""
-        super().__init__(color, name, game)
-
-        # Horses' move
-        self._UP_UP_LEFT = self._UP + self._UP_LEFT
-        self._UP_UP_RIGHT = self._UP + self._UP_RIGHT
-        self._DOWN_DOWN_LEFT = self._DOWN + self._DOWN_LEFT
-        self._DOWN_DOWN_RIGHT = self._DOWN + self._DOWN_RIGHT
-        self._LEFT_UP_LEFT = self._LEFT + self._UP_LEFT
-        self._LEFT_DOWN_LEFT = self._LEFT + self._DOWN_LEFT
-        self._RIGHT_UP_RIGHT = self._RIGHT + self._UP_RIGHT
-        self._RIGHT_DOWN_RIGHT = self._RIGHT + self._DOWN_RIGHT
+    # Horses' move
+    _UP_UP_LEFT = Piece._UP + Piece._UP_LEFT
+    _UP_UP_RIGHT = Piece._UP + Piece._UP_RIGHT
+    _DOWN_DOWN_LEFT = Piece._DOWN + Piece._DOWN_LEFT
+    _DOWN_DOWN_RIGHT = Piece._DOWN + Piece._DOWN_RIGHT
+    _LEFT_UP_LEFT = Piece._LEFT + Piece._UP_LEFT
+    _LEFT_DOWN_LEFT = Piece._LEFT + Piece._DOWN_LEFT
+    _RIGHT_UP_RIGHT = Piece._RIGHT + Piece._UP_RIGHT
+    _RIGHT_DOWN_RIGHT = Piece._RIGHT + Piece._DOWN_RIGHT
 
-        # Horses' all valid move
-        self._directions = [self._UP_UP_LEFT] + [self._UP_UP_RIGHT] + \
-                           [self._DOWN_DOWN_LEFT] + [self._DOWN_DOWN_RIGHT] + \
-                           [self._LEFT_UP_LEFT] + [self._LEFT_DOWN_LEFT] + \
-                           [self._RIGHT_UP_RIGHT] + [self._RIGHT_DOWN_RIGHT]
+    # Horses' all valid move
+    _BLUE_DIRECTIONS = _RED_DIRECTIONS = [_UP_UP_LEFT] + [_UP_UP_RIGHT] + \
+                                         [_DOWN_DOWN_LEFT] + [_DOWN_DOWN_RIGHT] + \
+                                         [_LEFT_UP_LEFT] + [_LEFT_DOWN_LEFT] + \
+                                         [_RIGHT_UP_RIGHT] + [_RIGHT_DOWN_RIGHT]
 
 
 class Soldiers(Piece):
@@ -375,30 +981,22 @@ class Soldiers(Piece):
     Represents a Soldiers class with a color and name. This class is the child class. Inherits all the methods and properties from Piece class.
     It can move one step, either forward of sideways. Within the fortress, the solider may also move forward along the diagonal lines.
     """
-    def __init__(self, color, name, game):
-        """Constructor for Soldiers."""
-        super().__init__(color, name, game)
-        if color == "B":
-            self._directions = [self._UP] + [self._RIGHT] + [self._LEFT]
-            # self.pos_to_additional_directions = {(2, 3): ["UP_RIGHT"], (2, 5): ["UP_LEFT"], (1, 4): ["UP_RIGHT", "UP_LEFT"]}
-        if color == "R":
-            self._directions = [self._DOWN] + [self._RIGHT] + [self._LEFT]
-            # self.pos_to_additional_directions = {(7, 3): ["DOWN_RIGHT"], (7, 5): ["DOWN_LEFT"], (8, 4): ["DOWN_RIGHT", "DOWN_LEFT"]}
+    __slots__ = ()
 
-        # Soldier's special move
-        if color == "B":
-            self._special_directions = {
-                (1, 4): [self._UP_RIGHT, self._UP_LEFT],
-                (2, 3): [self._UP_RIGHT],
-                (2, 5): [self._UP_LEFT],
+    _BLUE_DIRECTIONS = [Piece._UP] + [Piece._RIGHT] + [Piece._LEFT]
+    _RED_DIRECTIONS = [Piece._DOWN] + [Piece._RIGHT] + [Piece._LEFT]
 
-            }
-        else:
-            self._special_directions = {
-               (7, 3): [self._DOWN_RIGHT],
-               (7, 5): [self._DOWN_LEFT],
-               (8, 4): [self._DOWN_RIGHT, self._DOWN_LEFT],
-            }
+    # Soldier's special move, in the opponent's fortress
+    _BLUE_SPECIAL_DIRECTIONS = {
+        (1, 4): [Piece._UP_RIGHT, Piece._UP_LEFT],
+        (2, 3): [Piece._UP_RIGHT],
+        (2, 5): [Piece._UP_LEFT],
+    }
+    _RED_SPECIAL_DIRECTIONS = {
+        (7, 3): [Piece._DOWN_RIGHT],
+        (7, 5): [Piece._DOWN_LEFT],
+        (8, 4): [Piece._DOWN_RIGHT, Piece._DOWN_LEFT],
+    }
 
 
 class FortressPiece(Piece):
@@ -407,32 +1005,29 @@ class FortressPiece(Piece):
     It is also the parent class of the General and Guards class which have the same moving rule and range.
     Must stay within the fortress. It moves one point along any printed line in the fortress. It can moves diagonally along the printed lines.
     """
-    def __init__(self, color, name, game):
-        """Constructor for General."""
-        super().__init__(color, name, game)
-        if color == "B":
-            self._special_directions = {(7, 3): [self._RIGHT, self._DOWN, self._DOWN_RIGHT],
-                               (7, 4): [self._LEFT, self._RIGHT, self._DOWN],
-                               (7, 5): [self._LEFT, self._DOWN, self._DOWN_LEFT],
-                               (8, 3): [self._UP, self._DOWN, self._RIGHT],
-                               (8, 4): [self._UP, self._DOWN, self._RIGHT, self._LEFT,
-                                        self._UP_RIGHT, self._UP_LEFT, self._DOWN_RIGHT, self._DOWN_LEFT],
-                               (8, 5): [self._UP, self._DOWN, self._LEFT],
-                               (9, 3): [self._UP, self._RIGHT, self._UP_RIGHT],
-                               (9, 4): [self._UP, self._LEFT, self._RIGHT],
-                               (9, 5): [self._UP, self._LEFT, self._UP_LEFT],
-                               }
-        else:
-            self._special_directions = {(0, 3): [self._DOWN, self._RIGHT, self._DOWN_RIGHT],
-                               (0, 4): [self._LEFT, self._DOWN, self._RIGHT],
-                               (0, 5): [self._LEFT, self._DOWN, self._DOWN_LEFT],
-                               (1, 3): [self._UP, self._DOWN, self._RIGHT],
-                               (1, 4): [self._UP, self._DOWN, self._RIGHT, self._LEFT,
-                                        self._DOWN_RIGHT, self._DOWN_LEFT, self._UP_RIGHT, self._UP_LEFT],
-                               (1, 5): [self._UP, self._DOWN, self._LEFT],
-                               (2, 3): [self._UP, self._RIGHT, self._UP_RIGHT],
-                               (2, 4): [self._LEFT, self._UP, self._RIGHT],
-                               (2, 5): [self._LEFT, self._UP, self._UP_LEFT],
+    __slots__ = ()
+
+    _BLUE_SPECIAL_DIRECTIONS = {(7, 3): [Piece._RIGHT, Piece._DOWN, Piece._DOWN_RIGHT],
+                                (7, 4): [Piece._LEFT, Piece._RIGHT, Piece._DOWN],
+                                (7, 5): [Piece._LEFT, Piece._DOWN, Piece._DOWN_LEFT],
+                                (8, 3): [Piece._UP, Piece._DOWN, Piece._RIGHT],
+                                (8, 4): [Piece._UP, Piece._DOWN, Piece._RIGHT, Piece._LEFT,
+                                         Piece._UP_RIGHT, Piece._UP_LEFT, Piece._DOWN_RIGHT, Piece._DOWN_LEFT],
+                                (8, 5): [Piece._UP, Piece._DOWN, Piece._LEFT],
+                                (9, 3): [Piece._UP, Piece._RIGHT, Piece._UP_RIGHT],
+                                (9, 4): [Piece._UP, Piece._LEFT, Piece._RIGHT],
+                                (9, 5): [Piece._UP, Piece._LEFT, Piece._UP_LEFT],
+                                }
+    _RED_SPECIAL_DIRECTIONS = {(0, 3): [Piece._DOWN, Piece._RIGHT, Piece._DOWN_RIGHT],
+                               (0, 4): [Piece._LEFT, Piece._DOWN, Piece._RIGHT],
+                               (0, 5): [Piece._LEFT, Piece._DOWN, Piece._DOWN_LEFT],
+                               (1, 3): [Piece._UP, Piece._DOWN, Piece._RIGHT],
+                               (1, 4): [Piece._UP, Piece._DOWN, Piece._RIGHT, Piece._LEFT,
+                                        Piece._DOWN_RIGHT, Piece._DOWN_LEFT, Piece._UP_RIGHT, Piece._UP_LEFT],
+                               (1, 5): [Piece._UP, Piece._DOWN, Piece._LEFT],
+                               (2, 3): [Piece._UP, Piece._RIGHT, Piece._UP_RIGHT],
+                               (2, 4): [Piece._LEFT, Piece._UP, Piece._RIGHT],
+                               (2, 5): [Piece._LEFT, Piece._UP, Piece._UP_LEFT],
                                }
 
 
@@ -441,9 +1036,28 @@ class General(FortressPiece):
     Represents a General class with a color and name. This class is the child class. Inherits all the methods and properties from FortressPiece class.
     Must stay within the fortress. It moves one point along any printed line in the fortress. It can moves diagonally along the printed lines.
     """
-    def __init__(self, color, name, game):
-        """Constructor for General."""
-        super().__init__(color, name, game)
+    __slots__ = ()
+
+    def get_valid_moves(self, board, pos, occupancy=None):
+        """
+        Get all valid moves. The General cannot move to a square where it can be captured once it stands there.
+        The targets are tried on a copy of the board, so the board given is only read and can be immutable.
+        The occupancy of a target's own square does not matter to the check test, only that pos is left empty.
+        """
+        valid_moves = []
+        trial = bytearray(board)
+        trial[pos] = EMPTY
+        if occupancy is not None:
+            occupancy = list(occupancy)
+            for line, bit in _SQUARE_LINES[pos]:
+                occupancy[line] ^= bit
+        for target in super().get_valid_moves(board, pos):
+            captured = trial[target]
+            trial[target] = self._code
+            if not self.can_be_captured(trial, target, occupancy):
+                valid_moves.append(target)
+            trial[target] = captured
+        return valid_moves
 
 
 class Guards(FortressPiece):
@@ -451,112 +1065,334 @@ class Guards(FortressPiece):
     Represents a Guard class with a color and name. This class is the child class. Inherits all the methods and properties from FortressPiece class.
     It moves exactly the same as the general, and is also confined to the fortress.
     """
-    def __init__(self, color, name, game):
-        """Constructor for Guards."""
-        super().__init__(color, name, game)
+    __slots__ = ()
 
 
 class Chariots(Piece):
     """
     Represents a Chariots class with a color and name. This class is the child class. Inherits all the methods and properties from Piece class.
     Moves as many points as the max step in board. It can also move along the diagonal lines in the fortress.
+    Its moves along every line come from the occupancy tables (see _SLIDES); the rays are kept for the empty board.
     """
-    def __init__(self, color, name, game):
-        """Constructor for Chariots."""
-        super().__init__(color, name, game)
-
-        # Chariots' all possible directions
-        self._directions = [self._UP] + [self._DOWN] + [self._LEFT] + [self._RIGHT]
-
-        # Chariots' special move
-        self._special_directions = {
-            (7, 3): [self._DOWN_RIGHT],
-            (7, 5): [self._DOWN_LEFT],
-            (8, 4): [self._UP_RIGHT, self._UP_LEFT, self._DOWN_RIGHT, self._DOWN_LEFT],
-            (9, 3): [self._UP_RIGHT],
-            (9, 5): [self._UP_LEFT],
-            (0, 3): [self._DOWN_RIGHT],
-            (0, 5): [self._DOWN_LEFT],
-            (1, 4): [self._DOWN_RIGHT, self._DOWN_LEFT, self._UP_RIGHT, self._UP_LEFT],
-            (2, 3): [self._UP_RIGHT],
-            (2, 5): [self._UP_LEFT],
-
-        }
-
-        # Chariots' max step
-        self._max_step = 9
-        self._special_max_step = 2
+    __slots__ = ()
+
+    # Chariots' all possible directions
+    _BLUE_DIRECTIONS = _RED_DIRECTIONS = [Piece._UP] + [Piece._DOWN] + [Piece._LEFT] + [Piece._RIGHT]
+
+    # Chariots' special move
+    _BLUE_SPECIAL_DIRECTIONS = _RED_SPECIAL_DIRECTIONS = {
+        (7, 3): [Piece._DOWN_RIGHT],
+        (7, 5): [Piece._DOWN_LEFT],
+        (8, 4): [Piece._UP_RIGHT, Piece._UP_LEFT, Piece._DOWN_RIGHT, Piece._DOWN_LEFT],
+        (9, 3): [Piece._UP_RIGHT],
+        (9, 5): [Piece._UP_LEFT],
+        (0, 3): [Piece._DOWN_RIGHT],
+        (0, 5): [Piece._DOWN_LEFT],
+        (1, 4): [Piece._DOWN_RIGHT, Piece._DOWN_LEFT, Piece._UP_RIGHT, Piece._UP_LEFT],
+        (2, 3): [Piece._UP_RIGHT],
+        (2, 5): [Piece._UP_LEFT],
+    }
+
+    # Chariots' max step
+    _max_step = 9
+    _special_max_step = 2
+
+    def _build_moves(self, directions, special_directions):
+        """Build the table of moves: for every square, a tuple of rays, each ray the tuple of squares in one direction."""
+        return [tuple(tuple(target for target, _ in ray) for ray in self._get_rays(pos, directions, special_directions))
+                for pos in range(NUM_SQUARES)]
+
+    def _build_attacks(self):
+        """Every ray, palace diagonals included, can be walked both ways, so the rays are their own reverse table."""
+        return self._moves
+
+    def get_empty_board_moves(self, pos):
+        """Get the squares along every ray from pos, as (target, squares passed over on the way) pairs"""
+        return tuple((target, ray[:index]) for ray in self._moves[pos] for index, target in enumerate(ray))
+
+    def get_empty_board_sources(self, pos):
+        """Get the moves to square pos on an empty board: the rays are walked both ways, so the moves from pos"""
+        return self.get_empty_board_moves(pos)
+
+    def get_valid_moves(self, board, pos, occupancy=None):
+        """Get all valid moves. Slides along each line up to the first piece, which it can capture if it is an enemy."""
+        valid_moves = []
+        color_bit = self._code & BLUE_BIT
+        for line, table in _SLIDES[pos]:
+            empty, directions = table[occupancy[line] if occupancy is not None else _read_line(board, line)]
+            valid_moves += empty
+            for first, _, _ in directions:
+                if board[first] & BLUE_BIT != color_bit:
+                    valid_moves.append(first)
+        return valid_moves
 
 
-class Cannons(Piece):
+class Cannons(Chariots):
     """
-    Represents a Cannons class with a color and name. This class is the child class. Inherits all the methods and properties from Piece class.
+    Represents a Cannons class with a color and name. This class is the child class. Inherits the rays of the Chariots class.
     The cannon moves along any straight line, including the lines within the fortress, but must have one piece to jump over.
     It may not move without jumping. Also, it may not leap over another cannon, and may never capture another cannon.
     """
-    def __init__(self, color, name, board):
-        """Constructor for Cannons."""
-        super().__init__(color, name, board)
-        self._directions = [self._UP] + [self._DOWN] + [self._LEFT] + [self._RIGHT]
-
-        # Cannons' special move
-        self._special_directions = {
-            (7, 3): [self._DOWN_RIGHT],
-            (7, 5): [self._DOWN_LEFT],
-            (9, 3): [self._UP_RIGHT],
-            (9, 5): [self._UP_LEFT],
-            (0, 3): [self._DOWN_RIGHT],
-            (0, 5): [self._DOWN_LEFT],
-            (2, 3): [self._UP_RIGHT],
-            (2, 5): [self._UP_LEFT],
-        }
-        self._max_step = max(self._num_rows, self._num_cols)
-        self._special_max_step = 2
-
-    def get_valid_moves(self, pos):
-        """Get all valid moves."""
+    __slots__ = ()
+
+    # Cannons' special move, only between the corners of a fortress
+    _BLUE_SPECIAL_DIRECTIONS = _RED_SPECIAL_DIRECTIONS = {
+        (7, 3): [Piece._DOWN_RIGHT],
+        (7, 5): [Piece._DOWN_LEFT],
+        (9, 3): [Piece._UP_RIGHT],
+        (9, 5): [Piece._UP_LEFT],
+        (0, 3): [Piece._DOWN_RIGHT],
+        (0, 5): [Piece._DOWN_LEFT],
+        (2, 3): [Piece._UP_RIGHT],
+        (2, 5): [Piece._UP_LEFT],
+    }
+    _max_step = max(NUM_ROWS, NUM_COLS)
+
+    def get_valid_moves(self, board, pos, occupancy=None):
+        """Get all valid moves. Jumps the first piece along each line, onto the empty squares or the enemy behind it."""
         valid_moves = []
-        from_row, from_col = pos
-        piece_from = self._board[from_row][from_col]
-
-        max_steps = [self._max_step] * len(self._directions)
-        bounds = [((0, 0), (self._num_rows-1, self._num_cols-1))] * len(self._directions)
-        directions = self._directions[:]
-
-        if pos in self._special_directions:
-            directions += self._special_directions[pos]
-            max_steps += [self._special_max_step] * len(self._special_directions)
-            if self._color == "B":
-                bounds += [((7, 3), (9, 5))] * len(self._special_directions)
-            else:
-                bounds += [((0, 3), (2, 5))] * len(self._special_directions)
-
-        # start to check every move is invalid or not
-        for i, direction in enumerate(directions):
-            has_encountered = False
-            max_step = max_steps[i]
-            top_left, bottom_right = bounds[i]
-            top_row, left_col = top_left
-            bottom_row, right_col = bottom_right
-            for step in range(1, max_step+1):
-                pos = (pos[0] + direction[0][0], pos[1] + direction[0][1])
-                # if it is out of range
-                if pos[0] < top_row or pos[0] >= bottom_row or pos[1] < left_col or pos[1] >= right_col:
-                    break
+        color_bit = self._code & BLUE_BIT
+        for line, table in _SLIDES[pos]:
+            for first, after, second in table[occupancy[line] if occupancy is not None else _read_line(board, line)][1]:
+                # if the first encountered piece is Cannon, cannot jump
+                if board[first] & TYPE_MASK == CANNON:
+                    continue
+                valid_moves += after
+                if second >= 0:
+                    code = board[second]
+                    if code & BLUE_BIT != color_bit and code & TYPE_MASK != CANNON:
+                        valid_moves.append(second)
+        return valid_moves
 
-                piece = self._board[pos[0]][pos[1]]
-                if not has_encountered:
-                    if piece:
-                        # if the first encountered piece is Cannon, cannot jump
-                        if piece.get_name() == "A":
-                            break
-                        has_encountered = True
-                else:
-                    if not piece:
-                        valid_moves.append(pos)
-                    else:
-                        if not (piece.get_color() == piece_from.get_color() or piece.get_name() == "A"):
-                            valid_moves.append(pos)
+
+def board_printer(game, move_from, move_to, captured):
+    """An observer printing the board after every move but a pass: JanggiGame(observers=[board_printer])."""
+    if move_from != move_to:
+        game.print_board()
+
+
+# One shared, stateless instance per piece code; PIECES[0] is None for an empty square.
+PIECES = [None] * (2 * BLUE_BIT)
+for _color in ("R", "B"):
+    for _piece in (General(_color, "K"), Guards(_color, "G"), Elephants(_color, "E"), Horses(_color, "H"),
+                   Chariots(_color, "C"), Cannons(_color, "A"), Soldiers(_color, "S")):
+        PIECES[_piece.get_code()] = _piece
+del _color, _piece
+
+# rays out of every square, shared by chariots and cannons, and the reverse tables of the stepping pieces of each color
+_RAYS = PIECES[CHARIOT]._moves
+_STEP_ATTACKS = {color_bit: [(code, PIECES[code]._attacks) for code in
+                             (HORSE | color_bit, ELEPHANT | color_bit, SOLDIER | color_bit, GUARD | color_bit, GENERAL | color_bit)]
+                 for color_bit in (0, BLUE_BIT)}
+
+
+def _is_attacked_by(board, pos, color_bit, cannon_target, occupancy=None):
+    """
+    Check if a piece of the color color_bit could capture on square pos a piece that is a cannon if cannon_target,
+    whatever stands on pos. Instead of generating every opponent move, look outward from pos: look up the pieces
+    along the lines through pos for a chariot or a cannon (see _SLIDES), then look at the squares a stepping piece
+    could reach pos from. Return at the first attacker. occupancy is the line occupancy, read from the board if None.
+    """
+    chariot = CHARIOT | color_bit
+    # a cannon may never capture another cannon
+    cannon = CANNON | color_bit if not cannon_target else -1
+    for line, table in _SLIDES[pos]:
+        for first, _, second in table[occupancy[line] if occupancy is not None else _read_line(board, line)][1]:
+            code = board[first]
+            if code == chariot:
+                return True
+            # a cannon cannot jump over another cannon
+            if second >= 0 and board[second] == cannon and code & TYPE_MASK != CANNON:
+                return True
+    for code, attacks in _STEP_ATTACKS[color_bit]:
+        for square, blockers in attacks[pos]:
+            if board[square] == code:
+                for blocker in blockers:
+                    if board[blocker]:
                         break
-            pos = (from_row, from_col)  # reset position
-        return valid_moves
+                else:
+                    return True
+    return False
+
+
+def get_piece(color, name):
+    """Get the shared piece for a color ("R" or "B") and a name such as "K" or "C"."""
+    return PIECES[(PIECE_TYPES.index(name) + 1) | (BLUE_BIT if color == "B" else 0)]
+
+
+# bound stored with a value in the transposition table
+TT_EXACT, TT_LOWER, TT_UPPER = range(3)
+
+
+class TranspositionTable(object):
+    """
+    Represents a bounded transposition table keyed by Zobrist key, so search and analysis can reuse results
+    across transpositions and repeated positions. It has a fixed number of slots; a key maps to one slot.
+    An entry is replaced by one from a newer search (see new_search), or by one searched at least as deep.
+    """
+
+    def __init__(self, size=1 << 20):
+        """Constructor for TranspositionTable. The size is rounded down to a power of two slots."""
+        self._mask = (1 << (max(size, 1).bit_length() - 1)) - 1
+        self._slots = [None] * (self._mask + 1)     # (key, depth, value, bound, move, generation)
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self):
+        """Number of slots in use."""
+        return len(self._slots) - self._slots.count(None)
+
+    def new_search(self):
+        """Start a new search: entries stored before it may now be replaced whatever their depth."""
+        self._generation += 1
+
+    def clear(self):
+        """Remove every entry and reset the statistics."""
+        self._slots = [None] * (self._mask + 1)
+        self._hits = self._misses = 0
+
+    def probe(self, key):
+        """Get the (depth, value, bound, move) stored for key, None if it is not in the table."""
+        entry = self._slots[key & self._mask]
+        if entry is not None and entry[0] == key:
+            self._hits += 1
+            return entry[1:5]
+        self._misses += 1
+        return None
+
+    def store(self, key, depth, value, bound=TT_EXACT, move=None):
+        """Store a value searched to depth for key, with its bound and best move, if the replacement policy allows."""
+        index = key & self._mask
+        entry = self._slots[index]
+        if entry is None or entry[0] == key or entry[5] != self._generation or depth >= entry[1]:
+            if move is None and entry is not None and entry[0] == key:
+                # keep the best move of a previous search of the same position
+                move = entry[4]
+            self._slots[index] = (key, depth, value, bound, move, self._generation)
+
+    def get_stats(self):
+        """Get the number of probe hits and misses, and the number of slots in use."""
+        return {"hits": self._hits, "misses": self._misses, "used": len(self), "size": len(self._slots)}
+
+
+def _get_signature_squares(code, pos):
+    """
+    Get the squares the moves of piece code from pos depend on, and the squares whether it can be captured on pos
+    depends on: the row, the column and the palace diagonals for chariots, cannons and the check test, the targets
+    and the squares passed over for the stepping pieces, and the squares the opponent's stepping pieces reach pos from.
+    """
+    piece_type = code & TYPE_MASK
+    lines = set(range(pos - pos % NUM_COLS, pos - pos % NUM_COLS + NUM_COLS))
+    lines.update(range(pos % NUM_COLS, NUM_SQUARES, NUM_COLS))
+    for ray in _RAYS[pos]:
+        lines.update(ray)
+    if piece_type in (CHARIOT, CANNON):
+        move_squares = set(lines)
+    else:
+        move_squares = {pos}
+        for target, blockers in PIECES[code]._moves[pos]:
+            move_squares.add(target)
+            move_squares.update(blockers)
+    check_squares = lines
+    for _, attacks in _STEP_ATTACKS[code & BLUE_BIT ^ BLUE_BIT]:
+        for square, blockers in attacks[pos]:
+            check_squares.add(square)
+            check_squares.update(blockers)
+    return itemgetter(*sorted(move_squares)), itemgetter(*sorted(check_squares))
+
+
+# for every piece code and square, the getters of the move signature and of the check signature, see MoveCache
+_SIGNATURES = [[_get_signature_squares(code, pos) for pos in range(NUM_SQUARES)] if PIECES[code] else None
+               for code in range(2 * BLUE_BIT)]
+
+
+class MoveCache(object):
+    """
+    Represents a bounded LRU cache of move generation and check tests. The moves of a piece on a square depend only
+    on the pieces on a few squares, and so does whether it can be captured there: the cache is keyed on the piece
+    code, the square and the codes on those squares, its signature, read from the board with one itemgetter call.
+    A position reached again, or another position that differs only away from those squares, is a hit.
+    The General's moves are not cached as such, they are the palace steps whose check tests are cached.
+    Give a cache to a game with JanggiGame.set_move_cache; one cache can be shared by any number of games.
+    """
+
+    def __init__(self, size=1 << 16):
+        """Constructor for MoveCache. size is the number of entries kept for moves, and as many for check tests."""
+        self._size = size
+        self._moves = OrderedDict()
+        self._checks = OrderedDict()
+        self._move_hits = 0
+        self._move_misses = 0
+        self._check_hits = 0
+        self._check_misses = 0
+
+    def __len__(self):
+        """Number of entries."""
+        return len(self._moves) + len(self._checks)
+
+    def clear(self):
+        """Remove every entry and reset the statistics."""
+        self._moves.clear()
+        self._checks.clear()
+        self._move_hits = self._move_misses = self._check_hits = self._check_misses = 0
+
+    def get_valid_moves(self, board, pos, occupancy=None):
+        """Get the valid moves of the piece on square pos, see Piece.get_valid_moves, as a tuple not to be changed."""
+        code = board[pos]
+        if code & TYPE_MASK == GENERAL:
+            return self._get_general_moves(board, pos, code, occupancy)
+        key = (code, pos, _SIGNATURES[code][pos][0](board))
+        entries = self._moves
+        moves = entries.get(key)
+        if moves is None:
+            self._move_misses += 1
+            moves = entries[key] = tuple(PIECES[code].get_valid_moves(board, pos, occupancy))
+            if len(entries) > self._size:
+                entries.popitem(last=False)
+        else:
+            self._move_hits += 1
+            entries.move_to_end(key)
+        return moves
+
+    def _get_general_moves(self, board, pos, code, occupancy):
+        """
+        Get the moves of the General on pos: its palace steps to squares where it cannot be captured.
+        Like General.get_valid_moves, the targets are tried on a copy of the board.
+        """
+        valid_moves = []
+        trial = bytearray(board)
+        trial[pos] = EMPTY
+        if occupancy is not None:
+            occupancy = list(occupancy)
+            for line, bit in _SQUARE_LINES[pos]:
+                occupancy[line] ^= bit
+        for target in Piece.get_valid_moves(PIECES[code], board, pos):
+            captured = trial[target]
+            trial[target] = code
+            if not self.can_be_captured(trial, target, occupancy):
+                valid_moves.append(target)
+            trial[target] = captured
+        return tuple(valid_moves)
+
+    def can_be_captured(self, board, pos, occupancy=None):
+        """Check if the piece on square pos could be captured there, see Piece.can_be_captured."""
+        code = board[pos]
+        key = (code, pos, _SIGNATURES[code][pos][1](board))
+        entries = self._checks
+        attacked = entries.get(key)
+        if attacked is None:
+            self._check_misses += 1
+            attacked = entries[key] = PIECES[code].can_be_captured(board, pos, occupancy)
+            if len(entries) > self._size:
+                entries.popitem(last=False)
+        else:
+            self._check_hits += 1
+            entries.move_to_end(key)
+        return attacked
+
+    def get_stats(self):
+        """Get the hits and misses of the moves and of the check tests, and the number of entries and their bound."""
+        return {"move_hits": self._move_hits, "move_misses": self._move_misses,
+                "check_hits": self._check_hits, "check_misses": self._check_misses,
+                "used": len(self), "size": 2 * self._size}
@@ -0,0 +1,125 @@
+# Description: Parallel self-play and archive replay for JanggiGame over a pool of worker processes.
+# Games are sharded into chunks, each chunk is played or replayed by one worker, and the results are streamed back
+# as chunks complete. Games cross process boundaries in the compact form of JanggiGame.__getstate__
+# (board buffer, turn and state), never as object graphs, and only a bounded number of chunks is in flight,
+# so an archive can be streamed through without loading it all.
+# Command line:
+#   python JanggiParallel.py selfplay GAMES [--workers N] [--depth D] [--max-moves M] [--seed S] [--random-plies P]
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from JanggiGame import JanggiGame, SQUARE_NAMES
+from JanggiReplay import ReplayResult, replay
+from JanggiSearch import Searcher
+
+# square index of every algebraic name, for the moves returned by a search
+_SQUARE_INDEX = {name: sq for sq, name in enumerate(SQUARE_NAMES)}
+# random moves played before searching, so that searched games with different seeds differ
+DEFAULT_RANDOM_PLIES = 4
+
+
+def _replay_chunk(chunk, start):
+    """Worker: replay a chunk of (index, moves) pairs and return (index, ReplayResult) pairs."""
+    return [(index, replay(moves, start)) for index, moves in chunk]
+
+
+def play_game(seed, depth=0, max_moves=200, start=None, random_plies=DEFAULT_RANDOM_PLIES):
+    """
+    Play one game against itself and return its ReplayResult. With depth 0 each player picks a random legal move,
+    otherwise the first random_plies moves are random and the others are found by a search to depth.
+    The search is deterministic, so the random moves, drawn from seed, are what makes searched games differ.
+    The game ends at checkmate or after max_moves moves.
+    """
+    rng = random.Random(seed)
+    game = start.copy() if start is not None else JanggiGame()
+    searcher = Searcher(tt_size=1 << 16) if depth > 0 else None
+    moves = []
+    while len(moves) < max_moves and game.get_game_state() == "UNFINISHED":
+        if searcher is not None and len(moves) >= random_plies:
+            move_from, move_to = searcher.search(game, depth=depth).get_move()
+            move = (_SQUARE_INDEX[move_from], _SQUARE_INDEX[move_to])
+        else:
+            move = rng.choice(game.legal_moves(game.get_player()))
+        game.play(move)
+        moves.append(move)
+    return ReplayResult(game, moves, None, start)
+
+
+def _play_chunk(chunk, depth, max_moves, start, random_plies):
+    """Worker: play a chunk of (index, seed) pairs and return (index, ReplayResult) pairs."""
+    return [(index, play_game(seed, depth, max_moves, start, random_plies)) for index, seed in chunk]
+
+
+def _run(task, items, args, workers, chunk_size):
+    """
+    Run task(chunk, *args) over chunks of the (index, item) pairs of items on a pool of workers.
+    Yield (index, result) pairs as chunks complete, keeping at most two chunks per worker in flight.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = iter(lambda: list(itertools.islice(items, chunk_size)), [])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for chunk in itertools.islice(chunks, 2 * workers):
+            pending.add(executor.submit(task, chunk, *args))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for result in future.result():
+                    yield result
+                for chunk in itertools.islice(chunks, 1):
+                    pending.add(executor.submit(task, chunk, *args))
+
+
+def replay_parallel(games, workers=None, chunk_size=64, start=None):
+    """
+    Replay an iterable of move lists (see JanggiReplay.replay) on a pool of workers.
+    Yield (index, ReplayResult) pairs as they complete, index being the position of the game in games.
+    """
+    return _run(_replay_chunk, enumerate(games), (start,), workers, chunk_size)
+
+
+def self_play_parallel(num_games, workers=None, depth=0, max_moves=200, seed=0, chunk_size=8, start=None,
+                       random_plies=DEFAULT_RANDOM_PLIES):
+    """
+    Play num_games games of self-play (see play_game) on a pool of workers, game i using seed + i.
+    Yield (index, ReplayResult) pairs as they complete.
+    """
+    seeds = ((index, seed + index) for index in range(num_games))
+    return _run(_play_chunk, seeds, (depth, max_moves, start, random_plies), workers, chunk_size)
+
+
+def main(argv=None):
+    """Command line entry point, see the description at the top of the file."""
+    parser = argparse.ArgumentParser(description="Parallel self-play for JanggiGame.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    self_play_parser = commands.add_parser("selfplay", help="play games against itself")
+    self_play_parser.add_argument("games", type=int)
+    self_play_parser.add_argument("--workers", type=int, default=None)
+    self_play_parser.add_argument("--depth", type=int, default=0, help="search depth, 0 for random moves")
+    self_play_parser.add_argument("--max-moves", type=int, default=200)
+    self_play_parser.add_argument("--seed", type=int, default=0)
+    self_play_parser.add_argument("--random-plies", type=int, default=DEFAULT_RANDOM_PLIES,
+                                  help="random moves before searching, with --depth")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    states = {}
+    moves = 0
+    for _, result in self_play_parallel(args.games, args.workers, args.depth, args.max_moves, args.seed,
+                                        random_plies=args.random_plies):
+        states[result.get_game_state()] = states.get(result.get_game_state(), 0) + 1
+        moves += result.get_moves_played()
+    elapsed = time.perf_counter() - start
+    print("games: %d  moves: %d  time: %.3fs  games/s: %.1f  %s"
+          % (args.games, moves, elapsed, args.games / elapsed if elapsed else 0, states))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
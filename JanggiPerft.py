@@ -0,0 +1,202 @@
+# Description: Perft and move generation benchmarks for JanggiGame.
+# perft counts the leaf nodes of the legal move tree to a given depth, passes included. The counts from the starting
+# layout and from a few saved positions are known, so a change in the move generator that changes any count is caught.
+# The benchmark reports the throughput of each piece's move generator, of the check test and of full make/unmake.
+# Command line:
+#   python JanggiPerft.py perft DEPTH [--position NAME] [--divide] [--cache]
+#   python JanggiPerft.py check [--depth DEPTH] [--cache]
+#   python JanggiPerft.py bench [--depth DEPTH]
+
+import argparse
+import sys
+import time
+
+from JanggiGame import JanggiGame, MoveCache, PIECES, PIECE_TYPES, SQUARE_NAMES, TYPE_MASK, GENERAL
+
+# saved positions, each the list of moves leading to it from the starting layout
+SAVED_POSITIONS = {
+    "start": [],
+    # twelve quiet developing moves, no captures yet
+    "middlegame": [("e9", "f9"), ("e2", "e3"), ("i7", "h7"), ("d1", "d2"), ("d10", "e10"), ("g4", "f4"),
+                   ("i10", "i5"), ("c4", "c5"), ("a10", "a8"), ("e4", "e5"), ("c7", "d7"), ("f1", "f2")],
+    # Red to move and in check from a Blue elephant, with seven legal escapes
+    "check": [("i7", "h7"), ("c4", "b4"), ("i10", "i6"), ("d1", "e1"), ("i6", "i4"), ("b3", "b6"), ("e7", "e6"),
+              ("b1", "d4"), ("i4", "g4"), ("b4", "c4"), ("b10", "d7"), ("e2", "d3"), ("e9", "e8"), ("e4", "e5"),
+              ("g4", "g1"), ("d3", "e2"), ("g1", "h1"), ("c4", "b4"), ("c10", "d8"), ("i1", "h1"), ("e6", "e5"),
+              ("c1", "a2"), ("d7", "b4")],
+    # after a string of exchanges, seventeen pieces left on open files
+    "open": [("b10", "d7"), ("e4", "d4"), ("a10", "a8"), ("h1", "i3"), ("e9", "e10"), ("c1", "d3"), ("i10", "i8"),
+             ("g4", "f4"), ("d7", "f4"), ("e2", "d2"), ("f4", "d1"), ("d2", "d1"), ("c7", "c6"), ("d3", "b2"),
+             ("a8", "a9"), ("a1", "a3"), ("e7", "d7"), ("g1", "e4"), ("a7", "a6"), ("e4", "g7"), ("a9", "f9"),
+             ("i1", "i2"), ("a6", "b6"), ("b3", "b7"), ("d7", "d6"), ("b7", "i7"), ("i8", "i7"), ("i2", "f2"),
+             ("b8", "b2"), ("f2", "b2"), ("i7", "i4"), ("b2", "b6"), ("c6", "b6"), ("g7", "i4"), ("f9", "f1"),
+             ("d1", "d2"), ("f1", "b1"), ("a3", "e3"), ("d6", "e6"), ("e3", "e6")],
+}
+
+# leaf node counts of each saved position for depth 1, 2, 3, 4
+REFERENCE_COUNTS = {
+    "start": [32, 1024, 33506, 1095844],
+    "middlegame": [35, 1298, 45472, 1670199],
+    "check": [7, 278, 8159, 325896],
+    "open": [3, 82, 2066, 51654],
+}
+
+
+def get_position(name):
+    """Get a new game set up at the saved position name."""
+    game = JanggiGame()
+    for move_from, move_to in SAVED_POSITIONS[name]:
+        if not game.make_move(move_from, move_to):
+            raise ValueError("illegal move %s-%s in saved position %s" % (move_from, move_to, name))
+    return game
+
+
+def perft(game, depth):
+    """Count the leaf nodes of the legal move tree of game to depth. The game is left as it was."""
+    moves = game.legal_moves(game.get_player())
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        game.push(move)
+        nodes += perft(game, depth - 1)
+        game.pop()
+    return nodes
+
+
+def divide(game, depth):
+    """Count the leaf nodes to depth under each legal move, as a dict keyed by algebraic (move_from, move_to)."""
+    counts = {}
+    for move in game.legal_moves(game.get_player()):
+        game.push(move)
+        counts[(SQUARE_NAMES[move[0]], SQUARE_NAMES[move[1]])] = perft(game, depth - 1)
+        game.pop()
+    return counts
+
+
+def check_reference_counts(depth=3, cache=None):
+    """
+    Compare perft of every saved position with the reference counts up to depth, using the MoveCache cache if given.
+    Return the list of mismatches.
+    """
+    mismatches = []
+    for name, counts in REFERENCE_COUNTS.items():
+        game = get_position(name)
+        game.set_move_cache(cache)
+        for d, expected in enumerate(counts[:depth], 1):
+            nodes = perft(game, d)
+            if nodes != expected:
+                mismatches.append((name, d, expected, nodes))
+    return mismatches
+
+
+def _collect_positions(depth):
+    """Get the positions of the legal move trees of the saved positions, up to depth, as (board, line occupancy) pairs."""
+    positions = []
+
+    def walk(game, d):
+        positions.append((bytearray(game.get_board()), list(game.get_occupancy())))
+        if d == 0:
+            return
+        for move in game.legal_moves(game.get_player()):
+            game.push(move)
+            walk(game, d - 1)
+            game.pop()
+
+    for name in SAVED_POSITIONS:
+        walk(get_position(name), depth)
+    return positions
+
+
+def benchmark(depth=2):
+    """
+    Measure throughput over the positions of the saved positions' move trees, up to depth.
+    Return a dict of rows, each (calls, moves, seconds): one per piece type for get_valid_moves,
+    one for can_be_captured on both Generals, and one for perft's full make/unmake, without and with a MoveCache.
+    """
+    positions = _collect_positions(depth)
+    results = {}
+    for index, name in enumerate(PIECE_TYPES):
+        calls = moves = 0
+        elapsed = 0.0
+        for board, occupancy in positions:
+            squares = [(PIECES[code], sq) for sq, code in enumerate(board) if code & TYPE_MASK == index + 1]
+            start = time.perf_counter()
+            for piece, sq in squares:
+                moves += len(piece.get_valid_moves(board, sq, occupancy))
+            elapsed += time.perf_counter() - start
+            calls += len(squares)
+        results["get_valid_moves " + name] = (calls, moves, elapsed)
+
+    generals = []
+    for board, occupancy in positions:
+        generals.extend((board, occupancy, PIECES[code], sq) for sq, code in enumerate(board)
+                        if code & TYPE_MASK == GENERAL)
+    start = time.perf_counter()
+    for board, occupancy, general, sq in generals:
+        general.can_be_captured(board, sq, occupancy)
+    results["can_be_captured"] = (len(generals), len(generals), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    nodes = sum(perft(get_position(name), depth + 1) for name in SAVED_POSITIONS)
+    results["perft make/unmake"] = (nodes, nodes, time.perf_counter() - start)
+
+    cache = MoveCache()
+    games = [get_position(name) for name in SAVED_POSITIONS]
+    for game in games:
+        game.set_move_cache(cache)
+    start = time.perf_counter()
+    nodes = sum(perft(game, depth + 1) for game in games)
+    results["perft cached"] = (nodes, nodes, time.perf_counter() - start)
+    return results
+
+
+def main(argv=None):
+    """Command line entry point, see the description at the top of the file."""
+    parser = argparse.ArgumentParser(description="Perft and move generation benchmarks for JanggiGame.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    perft_parser = commands.add_parser("perft", help="count leaf nodes to a depth")
+    perft_parser.add_argument("depth", type=int)
+    perft_parser.add_argument("--position", default="start", choices=sorted(SAVED_POSITIONS))
+    perft_parser.add_argument("--divide", action="store_true", help="count the nodes under each move")
+    perft_parser.add_argument("--cache", action="store_true", help="use a MoveCache")
+    check_parser = commands.add_parser("check", help="compare perft with the reference counts")
+    check_parser.add_argument("--depth", type=int, default=3)
+    check_parser.add_argument("--cache", action="store_true", help="use a MoveCache")
+    bench_parser = commands.add_parser("bench", help="measure move generation throughput")
+    bench_parser.add_argument("--depth", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    if args.command == "perft":
+        game = get_position(args.position)
+        if args.cache:
+            game.set_move_cache(MoveCache())
+        start = time.perf_counter()
+        if args.divide:
+            counts = divide(game, args.depth)
+            for (move_from, move_to), nodes in sorted(counts.items()):
+                print("%s-%s: %d" % (move_from, move_to, nodes))
+            nodes = sum(counts.values())
+        else:
+            nodes = perft(game, args.depth)
+        elapsed = time.perf_counter() - start
+        print("nodes: %d  time: %.3fs  nps: %d" % (nodes, elapsed, nodes / elapsed if elapsed else 0))
+        return 0
+
+    if args.command == "check":
+        mismatches = check_reference_counts(args.depth, MoveCache() if args.cache else None)
+        for name, depth, expected, nodes in mismatches:
+            print("%s depth %d: expected %d, got %d" % (name, depth, expected, nodes))
+        print("FAILED" if mismatches else "OK")
+        return 1 if mismatches else 0
+
+    for name, (calls, moves, elapsed) in benchmark(args.depth).items():
+        calls_rate = calls / elapsed if elapsed else 0
+        moves_rate = moves / elapsed if elapsed else 0
+        print("%-20s calls: %8d  moves: %8d  time: %.3fs  calls/s: %10d  moves/s: %10d"
+              % (name, calls, moves, elapsed, calls_rate, moves_rate))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# Description: Read-only, memory-mapped database of JanggiGame positions with a value for each, such as an evaluation
+# or the win/draw/loss counts of an opening book.
+# The file is a header followed by fixed-size records, each the Zobrist key of a position, its binary form
+# (JanggiGame.to_bytes) and its value packed with the struct format given when the file is written.
+# Records are sorted by key, so a lookup is a binary search on the mapped file. Only the keys it visits are read,
+# and a record is unpacked only when it matches, so the file can be far larger than memory.
+
+import mmap
+import struct
+
+from JanggiGame import POSITION_BYTES
+
+_MAGIC = b"JANGGIDB"
+_VERSION = 1
+# magic, version, number of records, value struct format padded with spaces
+_HEADER = struct.Struct("<8sIQ12s")
+_KEY = struct.Struct("<Q")
+
+
+def write_database(path, records, value_format="<i"):
+    """
+    Write a database of (game, value) records to path. value is a tuple packed with the struct format value_format,
+    or a single number for a format with one field. A position appearing more than once keeps its last value.
+    The records are sorted in memory before they are written.
+    """
+    value_struct = struct.Struct(value_format)
+    if len(value_format) > 12:
+        raise ValueError("value format too long: %r" % value_format)
+    entries = {}
+    for game, value in records:
+        if not isinstance(value, tuple):
+            value = (value,)
+        position = game.to_bytes()
+        entries[(game.get_zobrist_key(), position)] = value_struct.pack(*value)
+    with open(path, "wb") as file:
+        file.write(_HEADER.pack(_MAGIC, _VERSION, len(entries), value_format.encode("ascii").ljust(12)))
+        for key, position in sorted(entries):
+            file.write(_KEY.pack(key) + position + entries[(key, position)])
+
+
+class PositionDatabase(object):
+    """
+    Represents a read-only, memory-mapped position database written by write_database.
+    It can be used as a context manager, which closes it on exit.
+    """
+
+    def __init__(self, path):
+        """Constructor for PositionDatabase. Open the file at path and map it read-only."""
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # an empty file cannot be mapped
+            self._file.close()
+            raise ValueError("%s is not a position database" % path)
+        if len(self._map) < _HEADER.size:
+            self.close()
+            raise ValueError("%s is not a position database" % path)
+        magic, version, count, value_format = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise ValueError("%s is not a position database" % path)
+        self._value_struct = struct.Struct(value_format.decode("ascii").strip())
+        self._count = count
+        self._record_size = _KEY.size + POSITION_BYTES + self._value_struct.size
+        if len(self._map) != _HEADER.size + count * self._record_size:
+            self.close()
+            raise ValueError("%s is truncated" % path)
+
+    def __len__(self):
+        """Number of records."""
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Unmap and close the file."""
+        self._map.close()
+        self._file.close()
+
+    def _lower_bound(self, key, low=0):
+        """Get the index of the first record with a key not less than key, searching from record low."""
+        data = self._map
+        unpack_key = _KEY.unpack_from
+        size = self._record_size
+        base = _HEADER.size
+        high = self._count
+        while low < high:
+            middle = (low + high) // 2
+            if unpack_key(data, base + middle * size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _find(self, key, position, index):
+        """Get the value of the record for key and position, scanning the records with key from index, None if absent."""
+        data = self._map
+        size = self._record_size
+        offset = _HEADER.size + index * size
+        end = _HEADER.size + self._count * size
+        position_start = _KEY.size
+        while offset < end and _KEY.unpack_from(data, offset)[0] == key:
+            # several positions can share a key
+            if data[offset + position_start:offset + position_start + POSITION_BYTES] == position:
+                return self._value_struct.unpack_from(data, offset + position_start + POSITION_BYTES)
+            offset += size
+        return None
+
+    def lookup(self, game):
+        """Get the value stored for the position of game, as a tuple, None if it is not in the database."""
+        key = game.get_zobrist_key()
+        return self._find(key, game.to_bytes(), self._lower_bound(key))
+
+    def lookup_many(self, games):
+        """
+        Get the values stored for a batch of games, in the same order, None for positions not in the database.
+        The queries are sorted by key first, so each binary search starts where the previous one ended.
+        """
+        queries = sorted((game.get_zobrist_key(), index, game.to_bytes()) for index, game in enumerate(games))
+        values = [None] * len(queries)
+        low = 0
+        for key, index, position in queries:
+            low = self._lower_bound(key, low)
+            values[index] = self._find(key, position, low)
+        return values
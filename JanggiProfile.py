@@ -0,0 +1,255 @@
+# Description: Opt-in instrumentation of the JanggiGame hot paths.
+# enable() replaces the instrumented methods (move generators, the lazy legal move generators, check tests, the move
+# cache, move making, checkmate detection, board printing and search) with wrappers counting calls, cumulative time
+# and nodes; disable() puts the original methods back. Nothing is wrapped until enable() is called, so
+# instrumentation costs nothing when it is off.
+# Nodes are the moves returned by a move generator, the legal moves returned by legal_moves or yielded by
+# iter_legal_moves, and the nodes searched by a search. Piece methods are also counted per piece type, by the letters
+# of PIECE_TYPES.
+# Times are inclusive: a make_move includes the move generation and check tests it calls. The time of a lazy
+# generator is the time spent producing its moves, not the time its caller spends between them.
+# Counts are not locked, so calls made from several threads at the same time can be undercounted.
+# Command line:
+#   python JanggiProfile.py [--depth DEPTH] [--prometheus]
+
+import argparse
+import contextlib
+import functools
+import sys
+import time
+
+import JanggiGame
+import JanggiSearch
+
+# (name, piece type) -> [calls, seconds, nodes], piece type '' for functions that are not piece methods
+_stats = {}
+# (owner, attribute, original) of every method replaced by enable()
+_originals = []
+
+
+def _count_items(result):
+    """Nodes of a call returning a list of moves."""
+    return len(result)
+
+
+def _count_search_nodes(result):
+    """Nodes of a call returning a SearchResult."""
+    return result.get_nodes()
+
+
+def _count_yielded(result):
+    """Node counter of a call returning an iterator of moves: the wrapper counts each move as it is yielded."""
+
+
+def _targets():
+    """Get the methods to instrument as (owner, attribute, node counter or None, True for piece methods)."""
+    targets = []
+    for piece_class in (JanggiGame.Piece, JanggiGame.General, JanggiGame.Chariots, JanggiGame.Cannons):
+        targets.append((piece_class, "get_valid_moves", _count_items, True))
+    targets.append((JanggiGame.Piece, "can_be_captured", None, True))
+    for attribute, count_nodes in (("make_move", None), ("play", None), ("legal_moves", _count_items),
+                                   ("iter_legal_moves", _count_yielded), ("_generate_legal_moves", _count_yielded),
+                                   ("attacks", None), ("_is_checkmate", None), ("is_in_check", None),
+                                   ("print_board", None)):
+        targets.append((JanggiGame.JanggiGame, attribute, count_nodes, False))
+    targets.append((JanggiGame.MoveCache, "get_valid_moves", _count_items, False))
+    targets.append((JanggiGame.MoveCache, "can_be_captured", None, False))
+    targets.append((JanggiSearch.Searcher, "search", _count_search_nodes, False))
+    return targets
+
+
+def _record(key, calls, seconds, nodes):
+    """Add counts to the entry of key in the current stats."""
+    entry = _stats.get(key)
+    if entry is None:
+        entry = _stats[key] = [0, 0.0, 0]
+    entry[0] += calls
+    entry[1] += seconds
+    entry[2] += nodes
+
+
+def _count_iterator(iterator, key):
+    """Yield the items of iterator, recording the time spent producing each and counting each as a node."""
+    perf_counter = time.perf_counter
+    try:
+        while True:
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                _record(key, 0, perf_counter() - start, 0)
+                return
+            _record(key, 0, perf_counter() - start, 1)
+            yield item
+    finally:
+        # a caller stopping early closes the wrapped generator too
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+
+def _wrap(original, name, count_nodes, by_piece):
+    """Get a wrapper of original recording its calls in the current stats under name."""
+    perf_counter = time.perf_counter
+
+    if count_nodes is _count_yielded:
+        @functools.wraps(original)
+        def iterator_wrapper(self, *args, **kwargs):
+            start = perf_counter()
+            iterator = original(self, *args, **kwargs)
+            _record((name, ""), 1, perf_counter() - start, 0)
+            return _count_iterator(iterator, (name, ""))
+        return iterator_wrapper
+
+    @functools.wraps(original)
+    def wrapper(self, *args, **kwargs):
+        start = perf_counter()
+        result = None
+        try:
+            result = original(self, *args, **kwargs)
+            return result
+        finally:
+            elapsed = perf_counter() - start
+            nodes = count_nodes(result) if count_nodes is not None and result is not None else 0
+            _record((name, self.get_name() if by_piece else ""), 1, elapsed, nodes)
+    return wrapper
+
+
+def is_enabled():
+    """Check if the instrumentation is on."""
+    return bool(_originals)
+
+
+def enable():
+    """Turn the instrumentation on. The counts go on from where they were; see reset."""
+    if _originals:
+        return
+    for owner, attribute, count_nodes, by_piece in _targets():
+        original = owner.__dict__[attribute]
+        _originals.append((owner, attribute, original))
+        setattr(owner, attribute, _wrap(original, owner.__name__ + "." + attribute, count_nodes, by_piece))
+
+
+def disable():
+    """Turn the instrumentation off, putting the original methods back. The counts are kept."""
+    while _originals:
+        owner, attribute, original = _originals.pop()
+        setattr(owner, attribute, original)
+
+
+def reset():
+    """Forget the counts."""
+    _stats.clear()
+
+
+def _snapshot(stats):
+    """Get the snapshot dict of a stats dict, see snapshot."""
+    functions = {}
+    for (name, piece), (calls, seconds, nodes) in sorted(stats.items()):
+        row = functions.setdefault(name, {"calls": 0, "seconds": 0.0, "nodes": 0, "pieces": {}})
+        row["calls"] += calls
+        row["seconds"] += seconds
+        row["nodes"] += nodes
+        if piece:
+            row["pieces"][piece] = {"calls": calls, "seconds": seconds, "nodes": nodes}
+    return functions
+
+
+def snapshot():
+    """
+    Get the counts as a dict keyed by function, such as 'Cannons.get_valid_moves' or 'JanggiGame._is_checkmate'.
+    Each value is a dict of calls, seconds and nodes, and pieces, the same counts per piece type for piece methods.
+    """
+    return _snapshot(_stats)
+
+
+def to_prometheus(counts=None, prefix="janggi"):
+    """Format a snapshot, by default the current counts, in the Prometheus text exposition format."""
+    if counts is None:
+        counts = snapshot()
+    lines = []
+    for metric, field, help_text in (("calls_total", "calls", "Calls of instrumented functions."),
+                                     ("seconds_total", "seconds", "Cumulative time in instrumented functions."),
+                                     ("nodes_total", "nodes", "Moves generated or nodes searched.")):
+        lines.append("# HELP %s_%s %s" % (prefix, metric, help_text))
+        lines.append("# TYPE %s_%s counter" % (prefix, metric))
+        for name, row in counts.items():
+            if row["pieces"]:
+                for piece, piece_row in row["pieces"].items():
+                    lines.append('%s_%s{function="%s",piece="%s"} %r' % (prefix, metric, name, piece, piece_row[field]))
+            else:
+                lines.append('%s_%s{function="%s"} %r' % (prefix, metric, name, row[field]))
+    return "\n".join(lines) + "\n"
+
+
+class Profile(object):
+    """Represents the counts of one profile() block, available once the block is over."""
+
+    def __init__(self):
+        """Constructor for Profile."""
+        self._counts = None
+
+    def get_snapshot(self):
+        """Get the counts of the block as a snapshot dict, see snapshot"""
+        return self._counts
+
+    def to_prometheus(self):
+        """Get the counts of the block in the Prometheus text format"""
+        return to_prometheus(self._counts)
+
+    def format_report(self):
+        """Get the counts of the block as a table, the slowest functions first"""
+        rows = sorted(self._counts.items(), key=lambda item: -item[1]["seconds"])
+        lines = ["%-30s %10s %10s %12s" % ("function", "calls", "seconds", "nodes")]
+        for name, row in rows:
+            lines.append("%-30s %10d %10.4f %12d" % (name, row["calls"], row["seconds"], row["nodes"]))
+            for piece, piece_row in sorted(row["pieces"].items()):
+                lines.append("  %-28s %10d %10.4f %12d" % (piece, piece_row["calls"], piece_row["seconds"],
+                                                           piece_row["nodes"]))
+        return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def profile():
+    """
+    Profile the calls made inside a with block, such as one make_move or one search:
+        with profile() as result:
+            game.make_move('c1', 'e3')
+        print(result.format_report())
+    The instrumentation is on inside the block and back as it was after; the block's counts are added to the totals.
+    """
+    global _stats
+    outer = _stats
+    was_enabled = is_enabled()
+    result = Profile()
+    _stats = {}
+    enable()
+    try:
+        yield result
+    finally:
+        inner = _stats
+        _stats = outer
+        if not was_enabled:
+            disable()
+        for key, (calls, seconds, nodes) in inner.items():
+            entry = outer.setdefault(key, [0, 0.0, 0])
+            entry[0] += calls
+            entry[1] += seconds
+            entry[2] += nodes
+        result._counts = _snapshot(inner)
+
+
+def main(argv=None):
+    """Command line entry point: profile a search from the starting layout and print the counts."""
+    parser = argparse.ArgumentParser(description="Profile a JanggiGame search.")
+    parser.add_argument("--depth", type=int, default=JanggiSearch.DEFAULT_DEPTH)
+    parser.add_argument("--prometheus", action="store_true", help="print in the Prometheus text format")
+    args = parser.parse_args(argv)
+    with profile() as result:
+        JanggiSearch.search(JanggiGame.JanggiGame(), depth=args.depth)
+    print(result.to_prometheus() if args.prometheus else result.format_report())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
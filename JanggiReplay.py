@@ -0,0 +1,102 @@
+# Description: Batch replay of recorded JanggiGame move lists.
+# A move is a (move_from, move_to) pair, either of algebraic squares such as ('c10', 'c9') or of board indices.
+# Squares are parsed with one table lookup and moves are made with JanggiGame.play, which validates them like
+# make_move without printing. Positions along a replayed game are only rebuilt when they are asked for.
+
+from JanggiGame import JanggiGame, SQUARE_NAMES
+
+# every way of naming a square, algebraic or index, to its board index
+_SQUARE_LOOKUP = {name: sq for sq, name in enumerate(SQUARE_NAMES)}
+_SQUARE_LOOKUP.update((sq, sq) for sq in range(len(SQUARE_NAMES)))
+
+
+def parse_moves(moves):
+    """
+    Parse a list of moves into (from square, to square) pairs of board indices.
+    Parsing stops at the first move naming a square that is not on the board; its index is returned
+    with the parsed moves, None if every move was parsed.
+    """
+    lookup = _SQUARE_LOOKUP.get
+    parsed = []
+    for index, (move_from, move_to) in enumerate(moves):
+        pos = lookup(move_from)
+        to_pos = lookup(move_to)
+        if pos is None or to_pos is None:
+            return parsed, index
+        parsed.append((pos, to_pos))
+    return parsed, None
+
+
+class ReplayResult(object):
+    """
+    Represents the result of replaying one game: the final game, its state, the number of moves played,
+    and the index of the first illegal move, None if every move was legal.
+    """
+
+    def __init__(self, game, moves, illegal_index, start=None):
+        """
+        Constructor for ReplayResult. moves are the parsed moves that were played, start the starting game,
+        copied so that changing it afterwards does not change the positions rebuilt from it.
+        """
+        self._game = game
+        self._moves = moves
+        self._illegal_index = illegal_index
+        self._start = start.copy() if start is not None else None
+
+    def get_game(self):
+        """Get the game after the last legal move"""
+        return self._game
+
+    def get_game_state(self):
+        """Get the final game state: 'UNFINISHED', 'RED_WON', 'BLUE_WON' or 'DRAW'"""
+        return self._game.get_game_state()
+
+    def get_moves_played(self):
+        """Get the number of moves played"""
+        return len(self._moves)
+
+    def get_illegal_index(self):
+        """Get the index of the first illegal move, None if every move was legal"""
+        return self._illegal_index
+
+    def get_position(self, ply):
+        """
+        Get a new game at the position after ply moves, rebuilt from the start. The moves are known legal, so they
+        are pushed without validation, except the last one, played to set the game state: the game only ends on
+        the last move, so every position before it is unfinished.
+        """
+        game = self._start.copy() if self._start is not None else JanggiGame()
+        moves = self._moves[:ply]
+        for move in moves[:-1]:
+            game.push(move)
+        if moves:
+            game.play(moves[-1])
+        return game
+
+    def iter_positions(self):
+        """Yield the board buffer of every position of the game, from the start to the final one, as bytes."""
+        game = self._start.copy() if self._start is not None else JanggiGame()
+        yield bytes(game.get_board())
+        for move in self._moves:
+            game.push(move)
+            yield bytes(game.get_board())
+
+
+def replay(moves, start=None):
+    """
+    Replay a list of moves from the starting layout, or from a copy of the game start, and return a ReplayResult.
+    The replay stops at the first illegal move, or at the first move after the game is won or drawn.
+    """
+    game = start.copy() if start is not None else JanggiGame()
+    parsed, illegal_index = parse_moves(moves)
+    play = game.play
+    for index, move in enumerate(parsed):
+        if not play(move):
+            return ReplayResult(game, parsed[:index], index, start)
+    return ReplayResult(game, parsed, illegal_index, start)
+
+
+def replay_many(games, start=None):
+    """Replay every move list of games in turn, yielding a ReplayResult for each as soon as it is replayed."""
+    for moves in games:
+        yield replay(moves, start)
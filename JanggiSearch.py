@@ -0,0 +1,330 @@
+# Description: Search engine for JanggiGame. It chooses a move with negamax alpha-beta search and iterative deepening,
+# a transposition table keyed by the Zobrist key, move ordering (transposition table move, captures by most valuable
+# victim, killer moves, history), quiescence search on captures, and hard node and time budgets.
+# Positions are explored in place on a copy of the game with push and pop, using the game's legal move generator
+# with a move cache (see MoveCache) kept by the Searcher, so repeated check tests across the tree are lookups.
+
+import time
+
+from JanggiGame import (NUM_COLS, NUM_SQUARES, BLUE_BIT, TYPE_MASK, SQUARE_NAMES,
+                        GENERAL, GUARD, ELEPHANT, HORSE, CHARIOT, CANNON, SOLDIER,
+                        TranspositionTable, MoveCache, TT_EXACT, TT_LOWER, TT_UPPER)
+
+# material value of each piece type; the General is never captured
+PIECE_VALUES = {GENERAL: 0, GUARD: 300, ELEPHANT: 300, HORSE: 500, CHARIOT: 1300, CANNON: 700, SOLDIER: 200}
+
+MATE_SCORE = 100000
+MAX_PLY = 64
+DEFAULT_DEPTH = 3           # depth searched when neither a depth nor a budget is given
+_INFINITY = MATE_SCORE + 1
+_MATE_BOUND = MATE_SCORE - MAX_PLY
+
+
+def _piece_square_value(code, square):
+    """Get the value of a piece on a square, from the point of view of its owner: material plus a small positional bonus."""
+    piece_type = code & TYPE_MASK
+    row, col = divmod(square, NUM_COLS)
+    # rows advanced from the own side of the board
+    advance = 9 - row if code & BLUE_BIT else row
+    centrality = 4 - abs(col - 4)
+    bonus = 0
+    if piece_type == SOLDIER:
+        bonus = 10 * max(advance - 3, 0)
+    elif piece_type in (HORSE, ELEPHANT):
+        bonus = 5 * centrality
+    elif piece_type in (CHARIOT, CANNON):
+        bonus = 2 * centrality
+    return PIECE_VALUES[piece_type] + bonus
+
+
+# value of every piece code on every square, positive for Blue and negative for Red; the empty code scores 0
+PIECE_SQUARE_SCORES = [[0] * NUM_SQUARES if not code & TYPE_MASK else
+                       [_piece_square_value(code, sq) * (1 if code & BLUE_BIT else -1) for sq in range(NUM_SQUARES)]
+                       for code in range(2 * BLUE_BIT)]
+
+
+def evaluate(board):
+    """Evaluate a board buffer from Blue's point of view: positive is good for Blue."""
+    return sum(PIECE_SQUARE_SCORES[code][sq] for sq, code in enumerate(board) if code)
+
+
+class SearchResult(object):
+    """
+    Represents the result of a search: the best move in algebraic notation, its score from the point of view of
+    the player to move, the depth of the last completed iteration, and the nodes and time spent.
+    """
+
+    def __init__(self, move, score, depth, nodes, seconds):
+        """Constructor for SearchResult."""
+        self._move = move
+        self._score = score
+        self._depth = depth
+        self._nodes = nodes
+        self._seconds = seconds
+
+    def __repr__(self):
+        """A special method used to represent a class’s objects as a string."""
+        return "SearchResult(move=%r, score=%d, depth=%d, nodes=%d, nps=%d)" % (
+            self._move, self._score, self._depth, self._nodes, self.get_nps())
+
+    def get_move(self):
+        """Get the best move as a (move_from, move_to) pair for make_move, None if the player has no move."""
+        return self._move
+
+    def get_score(self):
+        """Get the score of the best move"""
+        return self._score
+
+    def get_depth(self):
+        """Get the depth of the last completed iteration"""
+        return self._depth
+
+    def get_nodes(self):
+        """Get the number of nodes searched, quiescence nodes included"""
+        return self._nodes
+
+    def get_seconds(self):
+        """Get the time spent in seconds"""
+        return self._seconds
+
+    def get_nps(self):
+        """Get the number of nodes searched per second"""
+        return int(self._nodes / self._seconds) if self._seconds > 0 else 0
+
+
+class _SearchAborted(Exception):
+    """Raised inside the search when the node or time budget runs out."""
+
+
+class Searcher(object):
+    """
+    Represents a search engine. The transposition table and the history scores are kept between searches,
+    so a Searcher reused along a game gets the benefit of its previous searches.
+    """
+
+    def __init__(self, tt_size=1 << 18, cache_size=1 << 16):
+        """Constructor for Searcher. cache_size bounds the move cache, 0 for none."""
+        self._tt = TranspositionTable(tt_size)
+        self._move_cache = MoveCache(cache_size) if cache_size else None
+        self._history = [0] * (NUM_SQUARES * NUM_SQUARES)   # indexed by from square * NUM_SQUARES + to square
+        self._killers = []
+        self._game = None
+        self._board = None
+        self._score = 0             # evaluation of the searched position from Blue's point of view
+        self._root_sign = 1         # 1 if Blue is to move at the root, -1 if Red
+        self._root_move = None
+        self._nodes = 0
+        self._max_nodes = None
+        self._deadline = None
+
+    def search(self, game, time_ms=None, depth=None, max_nodes=None):
+        """
+        Search the position of game and return a SearchResult. The game itself is not changed.
+        Iterative deepening goes up to depth, stopping early when time_ms milliseconds or max_nodes nodes are
+        spent; the move of the last completed iteration is returned. With no depth and no budget, DEFAULT_DEPTH
+        is searched. Raise ValueError if depth is less than 1, as no iteration would give a move.
+        """
+        start = time.perf_counter()
+        if depth is None:
+            depth = MAX_PLY if time_ms is not None or max_nodes is not None else DEFAULT_DEPTH
+        elif depth < 1:
+            raise ValueError("depth must be at least 1: %r" % depth)
+        self._game = game = game.copy()
+        game.set_move_cache(self._move_cache)
+        self._board = game.get_board()
+        self._score = evaluate(self._board)
+        self._root_sign = 1 if game.get_player() == "blue" else -1
+        self._killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self._nodes = 0
+        self._max_nodes = max_nodes
+        self._deadline = start + time_ms / 1000.0 if time_ms is not None else None
+        self._tt.new_search()
+
+        moves = game.legal_moves(game.get_player()) if game.get_game_state() == "UNFINISHED" else []
+        if not moves:
+            return SearchResult(None, 0, 0, 0, time.perf_counter() - start)
+
+        best_move, best_score, completed = moves[0], 0, 0
+        for iteration in range(1, depth + 1):
+            try:
+                score = self._negamax(iteration, -_INFINITY, _INFINITY, 0)
+            except _SearchAborted:
+                break
+            best_move, best_score, completed = self._root_move, score, iteration
+            # a forced mate will not get any shorter
+            if abs(score) >= _MATE_BOUND:
+                break
+
+        move = (SQUARE_NAMES[best_move[0]], SQUARE_NAMES[best_move[1]])
+        return SearchResult(move, best_score, completed, self._nodes, time.perf_counter() - start)
+
+    def get_move_cache(self):
+        """Get the move cache, None if there is none"""
+        return self._move_cache
+
+    def _count_node(self):
+        """Count a node and stop the search if a budget has run out."""
+        self._nodes += 1
+        if self._max_nodes is not None and self._nodes > self._max_nodes:
+            raise _SearchAborted()
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise _SearchAborted()
+
+    def _evaluate(self, ply):
+        """Evaluate the current position from the point of view of the player to move."""
+        return self._score * self._root_sign if ply % 2 == 0 else -self._score * self._root_sign
+
+    def _push(self, move):
+        """Make a move on the searched game and update the evaluation."""
+        from_pos, to_pos = move
+        if from_pos != to_pos:
+            board = self._board
+            scores = PIECE_SQUARE_SCORES[board[from_pos]]
+            self._score += scores[to_pos] - scores[from_pos] - PIECE_SQUARE_SCORES[board[to_pos]][to_pos]
+        self._game.push(move)
+
+    def _order_moves(self, moves, tt_move, ply):
+        """Sort moves best first: the transposition table move, captures by victim then attacker, killers, history."""
+        board = self._board
+        killers = self._killers[ply]
+        history = self._history
+
+        def order(move):
+            from_pos, to_pos = move
+            if move == tt_move:
+                return 1 << 30
+            victim = board[to_pos] if from_pos != to_pos else 0
+            if victim:
+                return (1 << 28) + PIECE_VALUES[victim & TYPE_MASK] * 16 - PIECE_VALUES[board[from_pos] & TYPE_MASK] // 100
+            if move == killers[0] or move == killers[1]:
+                return 1 << 27
+            return history[from_pos * NUM_SQUARES + to_pos]
+
+        return sorted(moves, key=order, reverse=True)
+
+    def _negamax(self, depth, alpha, beta, ply):
+        """Search the current position to depth and return its score from the point of view of the player to move."""
+        if depth <= 0:
+            return self._quiesce(alpha, beta, ply)
+        self._count_node()
+        game = self._game
+        key = game.get_zobrist_key()
+
+        tt_move = None
+        entry = self._tt.probe(key)
+        if entry is not None:
+            tt_depth, tt_value, tt_bound, tt_move = entry
+            if ply > 0 and tt_depth >= depth:
+                value = _value_from_tt(tt_value, ply)
+                if tt_bound == TT_EXACT or (tt_bound == TT_LOWER and value >= beta) or \
+                        (tt_bound == TT_UPPER and value <= alpha):
+                    return value
+
+        moves = game.legal_moves(game.get_player())
+        # a pass is legal unless the General is in check, so no legal move is checkmate
+        if not moves:
+            return -MATE_SCORE + ply
+        if ply >= MAX_PLY:
+            return self._evaluate(ply)
+
+        original_alpha = alpha
+        best_value, best_move = -_INFINITY, None
+        score = self._score
+        for move in self._order_moves(moves, tt_move, ply):
+            is_capture = move[0] != move[1] and self._board[move[1]]
+            self._push(move)
+            value = -self._negamax(depth - 1, -beta, -alpha, ply + 1)
+            game.pop()
+            self._score = score
+            if value > best_value:
+                best_value, best_move = value, move
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        if not is_capture:
+                            killers = self._killers[ply]
+                            if move != killers[0]:
+                                killers[1] = killers[0]
+                                killers[0] = move
+                            self._history[move[0] * NUM_SQUARES + move[1]] += depth * depth
+                        break
+
+        if best_value <= original_alpha:
+            bound = TT_UPPER
+        elif best_value >= beta:
+            bound = TT_LOWER
+        else:
+            bound = TT_EXACT
+        self._tt.store(key, depth, _value_to_tt(best_value, ply), bound, best_move)
+        if ply == 0:
+            self._root_move = best_move
+        return best_value
+
+    def _quiesce(self, alpha, beta, ply):
+        """Search captures only, until the position is quiet, so the evaluation is not taken in the middle of an exchange."""
+        self._count_node()
+        game = self._game
+        color = game.get_player()
+        stand_pat = self._evaluate(ply)
+        in_check = game.is_in_check(color)
+        if not in_check:
+            if stand_pat >= beta or ply >= MAX_PLY:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+
+        # only the captures are searched; out of check the pass is legal, so there is always a move, and in check
+        # the quiet moves are looked at only when there is no capture, up to the first legal one
+        captures = list(game.iter_legal_moves(color, quiet=False, passes=False))
+        if in_check and not captures and next(game.iter_legal_moves(color, captures=False, passes=False), None) is None:
+            return -MATE_SCORE + ply
+        if ply >= MAX_PLY:
+            return stand_pat
+
+        board = self._board
+        captures.sort(key=lambda move: PIECE_VALUES[board[move[1]] & TYPE_MASK] * 16 -
+                      PIECE_VALUES[board[move[0]] & TYPE_MASK] // 100, reverse=True)
+        best_value = stand_pat if not in_check else -_INFINITY
+        score = self._score
+        for move in captures:
+            self._push(move)
+            value = -self._quiesce(-beta, -alpha, ply + 1)
+            game.pop()
+            self._score = score
+            if value > best_value:
+                best_value = value
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+        # in check with only quiet escapes: the position is not lost, fall back to the evaluation
+        if best_value == -_INFINITY:
+            best_value = stand_pat
+        return best_value
+
+
+def _value_to_tt(value, ply):
+    """Mate scores are stored relative to the position, not to the root, so they stay right in transpositions."""
+    if value >= _MATE_BOUND:
+        return value + ply
+    if value <= -_MATE_BOUND:
+        return value - ply
+    return value
+
+
+def _value_from_tt(value, ply):
+    """Turn a mate score stored in the transposition table back into a score relative to the root."""
+    if value >= _MATE_BOUND:
+        return value - ply
+    if value <= -_MATE_BOUND:
+        return value + ply
+    return value
+
+
+def search(game, time_ms=None, depth=None, max_nodes=None):
+    """Search the position of game with a new Searcher and return the SearchResult, see Searcher.search."""
+    return Searcher().search(game, time_ms=time_ms, depth=depth, max_nodes=max_nodes)
+
+
+def best_move(game, time_ms=None, depth=None, max_nodes=None):
+    """Get the best move of the player to move as a (move_from, move_to) pair for make_move, None if there is none."""
+    return search(game, time_ms=time_ms, depth=depth, max_nodes=max_nodes).get_move()
@@ -0,0 +1,471 @@
+# Description: Asyncio server hosting many JanggiGame matches in one process.
+# Clients talk line-delimited JSON over TCP or a local Unix socket: every request is one JSON object on one line,
+# {"id": 1, "op": "make_move", "game": "g1", "move_from": "a7", "move_to": "b7"}, and is answered by one line,
+# {"id": 1, "result": ...} or {"id": 1, "error": "..."}. Requests are handled concurrently, so answers can come back
+# out of order and are matched by id. A client subscribed to a game is also sent an event line after every move,
+# {"event": "move", "game": "g1", "move_from": "a7", "move_to": "b7", "captured": null, "state": ..., "player": ...}.
+# Moves are validated with checkmate detection and searches can take seconds, so both run off the event loop: moves
+# on a small thread pool of their own, searches on a pool of processes, so a long search never holds up a move.
+# The event loop only parses, dispatches and answers the cheap requests, and a slow position never stalls the others.
+# Moves on one game are serialized by a lock per game; searches run on a copy of the position.
+# Operations:
+#   new_game [game] [fen] [max_moves] [max_repetitions]
+#                                        the game id, chosen by the server unless given; the start position or a FEN,
+#                                        and the draw limits (see JanggiGame.set_draw_limits), the server's by default
+#   make_move game move_from move_to     True if the move was made, see JanggiGame.make_move
+#   is_in_check game player              True if 'red' or 'blue' is in check
+#   get_game_state game                  'UNFINISHED', 'RED_WON', 'BLUE_WON' or 'DRAW'
+#   get_player game                      the player to move, 'blue' or 'red'
+#   get_fen game                         the position, see JanggiGame.to_fen
+#   best_move game [depth] [time_ms]     [move_from, move_to] of a search, None if there is no move; the search
+#                                        stops after the server's maximum search time whatever the request asks
+#   subscribe game, unsubscribe game     start or stop the move events of a game
+#   close_game game                      forget the game
+#   get_metrics                          the counts of JanggiProfile in the Prometheus text format
+# Command line:
+#   python JanggiServer.py [--host HOST] [--port PORT | --unix PATH] [--workers N]
+#                          [--search-processes N | --search-threads N] [--instrument]
+#                          [--max-moves N] [--max-repetitions N] [--max-search-ms MS]
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import JanggiProfile
+from JanggiGame import JanggiGame
+from JanggiSearch import DEFAULT_DEPTH, search
+
+DEFAULT_PORT = 7600
+# a subscriber whose unsent output grows past this many bytes is too slow and is disconnected
+MAX_PENDING_OUTPUT = 1 << 20
+# default longest time a best_move search may take, in milliseconds
+MAX_SEARCH_MS = 10000
+# default number of threads making moves; a move takes milliseconds, so a few keep up with many games
+MOVE_WORKERS = 4
+
+
+class _RequestError(Exception):
+    """Raised by a request handler to answer with an error message."""
+
+
+class _Match(object):
+    """Represents a hosted game with its lock and the connections subscribed to it."""
+
+    def __init__(self, game):
+        """Constructor for _Match."""
+        self._game = game
+        self._lock = asyncio.Lock()
+        self._subscribers = set()
+
+    def get_game(self):
+        """Get the game"""
+        return self._game
+
+    def get_lock(self):
+        """Get the lock serializing the moves of the game"""
+        return self._lock
+
+    def get_subscribers(self):
+        """Get the set of connections subscribed to the game"""
+        return self._subscribers
+
+
+class _Connection(object):
+    """Represents a client connection, writing one JSON object per line."""
+
+    def __init__(self, writer):
+        """Constructor for _Connection."""
+        self._writer = writer
+        self._subscriptions = set()
+
+    def get_subscriptions(self):
+        """Get the set of game ids the connection is subscribed to"""
+        return self._subscriptions
+
+    def send(self, message):
+        """Queue a message for sending. Return False if the connection is closing or too far behind."""
+        if self._writer.is_closing():
+            return False
+        if self._writer.transport.get_write_buffer_size() > MAX_PENDING_OUTPUT:
+            self._writer.close()
+            return False
+        self._writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+        return True
+
+    async def drain(self):
+        """Wait until the queued output is down to the transport's limits."""
+        if not self._writer.is_closing():
+            await self._writer.drain()
+
+
+class GameServer(object):
+    """
+    Represents a server hosting many games, see the description at the top of the file.
+    Moves run on executor, by default a pool of MOVE_WORKERS threads. Searches run on search_executor, by default
+    a ProcessPoolExecutor with a process per CPU, the position being sent in the compact form of JanggiGame pickling;
+    searches never share a worker with moves, so however many searches are running, moves are made right away.
+    max_moves and max_repetitions are the default draw limits of new games, so games cycling forever end as draws.
+    max_search_ms bounds every search, so no request can hold an executor worker for longer.
+    """
+
+    def __init__(self, executor=None, search_executor=None, max_moves=None, max_repetitions=None,
+                 max_search_ms=MAX_SEARCH_MS):
+        """Constructor for GameServer."""
+        self._executor = executor or ThreadPoolExecutor(max_workers=MOVE_WORKERS)
+        self._search_executor = search_executor or ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+        self._draw_limits = (max_moves, max_repetitions)
+        self._max_search_ms = max_search_ms
+        self._matches = {}
+        self._game_ids = itertools.count(1)
+        self._loop = None
+        self._handlers = {
+            "new_game": self._new_game,
+            "make_move": self._make_move,
+            "is_in_check": self._is_in_check,
+            "get_game_state": self._get_game_state,
+            "get_player": self._get_player,
+            "get_fen": self._get_fen,
+            "best_move": self._best_move,
+            "subscribe": self._subscribe,
+            "unsubscribe": self._unsubscribe,
+            "close_game": self._close_game,
+            "get_metrics": self._get_metrics,
+        }
+
+    def __len__(self):
+        """Number of hosted games."""
+        return len(self._matches)
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT, path=None):
+        """Start listening on a TCP host and port, or on the Unix socket path if given. Return the asyncio server."""
+        self._loop = asyncio.get_running_loop()
+        if path is not None:
+            return await asyncio.start_unix_server(self._serve_connection, path=path)
+        return await asyncio.start_server(self._serve_connection, host, port)
+
+    def shutdown(self):
+        """Shut the executors down, waiting for the calls in progress."""
+        self._executor.shutdown()
+        if self._search_executor is not self._executor:
+            self._search_executor.shutdown()
+
+    async def _serve_connection(self, reader, writer):
+        """Read the requests of one connection and handle each in its own task."""
+        connection = _Connection(writer)
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    # a line past the reader's limit, or a reset connection
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.ensure_future(self._handle_line(connection, line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for game_id in list(connection.get_subscriptions()):
+                match = self._matches.get(game_id)
+                if match is not None:
+                    match.get_subscribers().discard(connection)
+            if tasks:
+                await asyncio.wait(tasks)
+            writer.close()
+
+    async def _handle_line(self, connection, line):
+        """Handle one request line and send the answer."""
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                raise _RequestError("malformed JSON")
+            if not isinstance(request, dict):
+                raise _RequestError("a request must be a JSON object")
+            request_id = request.get("id")
+            handler = self._handlers.get(request.get("op"))
+            if handler is None:
+                raise _RequestError("unknown op: %r" % (request.get("op"),))
+            result = await handler(connection, request)
+            connection.send({"id": request_id, "result": result})
+        except _RequestError as error:
+            connection.send({"id": request_id, "error": str(error)})
+        except Exception as error:
+            # a bug must not leave the client waiting for an answer
+            connection.send({"id": request_id, "error": "internal error: %s: %s" % (type(error).__name__, error)})
+        try:
+            await connection.drain()
+        except ConnectionError:
+            pass
+
+    def _get_match(self, request):
+        """Get the match named by the game field of a request."""
+        game_id = self._get_field(request, "game")
+        match = self._matches.get(game_id)
+        if match is None:
+            raise _RequestError("unknown game: %r" % (game_id,))
+        return match
+
+    @staticmethod
+    def _get_field(request, name, types=str):
+        """Get a required field of a request, checking its type."""
+        value = request.get(name)
+        if not isinstance(value, types) or isinstance(value, bool) and types is not bool:
+            raise _RequestError("missing or invalid field: %s" % name)
+        return value
+
+    def _publish(self, game_id, event):
+        """Send an event to the subscribers of a game, dropping the connections that cannot keep up."""
+        match = self._matches.get(game_id)
+        if match is None:
+            return
+        for connection in list(match.get_subscribers()):
+            if not connection.send(event):
+                match.get_subscribers().discard(connection)
+
+    def _make_observer(self, game_id):
+        """
+        Get the observer publishing the moves of a game. It is called in an executor thread while the move is made,
+        so the event is built there and handed to the event loop.
+        """
+        def observer(game, move_from, move_to, captured):
+            event = {"event": "move", "game": game_id, "move_from": move_from, "move_to": move_to,
+                     "captured": captured.get_color() + captured.get_name() if captured else None,
+                     "state": game.get_game_state(), "player": game.get_player()}
+            self._loop.call_soon_threadsafe(self._publish, game_id, event)
+        return observer
+
+    async def _new_game(self, connection, request):
+        """Host a new game and return its id."""
+        game_id = request.get("game")
+        if game_id is None:
+            game_id = "g%d" % next(self._game_ids)
+            while game_id in self._matches:
+                game_id = "g%d" % next(self._game_ids)
+        elif not isinstance(game_id, str) or game_id in self._matches:
+            raise _RequestError("invalid or existing game id: %r" % (game_id,))
+        if request.get("fen") is None:
+            game = JanggiGame()
+        else:
+            try:
+                game = JanggiGame.from_fen(self._get_field(request, "fen"))
+            except ValueError as error:
+                raise _RequestError(str(error))
+        max_moves, max_repetitions = self._draw_limits
+        if request.get("max_moves") is not None:
+            max_moves = self._get_field(request, "max_moves", int)
+        if request.get("max_repetitions") is not None:
+            max_repetitions = self._get_field(request, "max_repetitions", int)
+        game.set_draw_limits(max_moves, max_repetitions)
+        game.add_observer(self._make_observer(game_id))
+        self._matches[game_id] = _Match(game)
+        return game_id
+
+    async def _make_move(self, connection, request):
+        """Make a move in the executor, holding the game's lock."""
+        match = self._get_match(request)
+        move_from = self._get_field(request, "move_from")
+        move_to = self._get_field(request, "move_to")
+        async with match.get_lock():
+            return await self._loop.run_in_executor(self._executor, match.get_game().make_move, move_from, move_to)
+
+    async def _is_in_check(self, connection, request):
+        """Check if a player is in check; one reverse lookup, done on the event loop."""
+        match = self._get_match(request)
+        player = self._get_field(request, "player")
+        if player not in ("red", "blue"):
+            raise _RequestError("player must be 'red' or 'blue'")
+        async with match.get_lock():
+            return match.get_game().is_in_check(player)
+
+    async def _get_game_state(self, connection, request):
+        """Get the state of a game."""
+        match = self._get_match(request)
+        async with match.get_lock():
+            return match.get_game().get_game_state()
+
+    async def _get_player(self, connection, request):
+        """Get the player to move."""
+        match = self._get_match(request)
+        async with match.get_lock():
+            return match.get_game().get_player()
+
+    async def _get_fen(self, connection, request):
+        """Get the position of a game as a FEN string."""
+        match = self._get_match(request)
+        async with match.get_lock():
+            return match.get_game().to_fen()
+
+    async def _best_move(self, connection, request):
+        """Search a copy of the position in the search executor and return the best move."""
+        match = self._get_match(request)
+        depth = request.get("depth")
+        time_ms = request.get("time_ms")
+        if depth is not None:
+            depth = self._get_field(request, "depth", int)
+            if depth < 1:
+                raise _RequestError("depth must be at least 1")
+        if time_ms is not None:
+            time_ms = self._get_field(request, "time_ms", (int, float))
+        if depth is None and time_ms is None:
+            depth = DEFAULT_DEPTH
+        time_ms = self._max_search_ms if time_ms is None else min(time_ms, self._max_search_ms)
+        async with match.get_lock():
+            game = match.get_game().copy()
+        result = await self._loop.run_in_executor(self._search_executor, search, game, time_ms, depth)
+        move = result.get_move()
+        return list(move) if move else None
+
+    async def _subscribe(self, connection, request):
+        """Send the connection the move events of a game."""
+        match = self._get_match(request)
+        match.get_subscribers().add(connection)
+        connection.get_subscriptions().add(self._get_field(request, "game"))
+        return True
+
+    async def _unsubscribe(self, connection, request):
+        """Stop sending the connection the move events of a game."""
+        match = self._get_match(request)
+        match.get_subscribers().discard(connection)
+        connection.get_subscriptions().discard(self._get_field(request, "game"))
+        return True
+
+    async def _close_game(self, connection, request):
+        """Forget a game once the move in progress, if any, is made."""
+        match = self._get_match(request)
+        game_id = self._get_field(request, "game")
+        async with match.get_lock():
+            self._matches.pop(game_id, None)
+        for subscriber in match.get_subscribers():
+            subscriber.get_subscriptions().discard(game_id)
+        return True
+
+    async def _get_metrics(self, connection, request):
+        """Get the instrumentation counts, empty unless JanggiProfile.enable() was called."""
+        return JanggiProfile.to_prometheus()
+
+
+class JanggiClient(object):
+    """
+    Represents a client of GameServer. request sends a request and waits for its answer; the events of the
+    subscribed games are put on the queue returned by get_events.
+    """
+
+    def __init__(self, reader, writer):
+        """Constructor for JanggiClient. Use connect or connect_unix."""
+        self._reader = reader
+        self._writer = writer
+        self._request_ids = itertools.count(1)
+        self._pending = {}
+        self._events = asyncio.Queue()
+        self._reading = asyncio.ensure_future(self._read())
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=DEFAULT_PORT):
+        """Connect to a server over TCP."""
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    @classmethod
+    async def connect_unix(cls, path):
+        """Connect to a server over a Unix socket."""
+        reader, writer = await asyncio.open_unix_connection(path)
+        return cls(reader, writer)
+
+    def get_events(self):
+        """Get the queue of event messages"""
+        return self._events
+
+    async def _read(self):
+        """Route every line read to the request waiting for it, or to the event queue."""
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if "event" in message:
+                    self._events.put_nowait(message)
+                else:
+                    future = self._pending.pop(message.get("id"), None)
+                    if future is not None and not future.done():
+                        future.set_result(message)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connection closed"))
+            self._pending.clear()
+
+    async def request(self, op, **fields):
+        """Send a request and return its result. An error answer raises RuntimeError with its message."""
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        fields.update(id=request_id, op=op)
+        self._writer.write(json.dumps(fields).encode() + b"\n")
+        await self._writer.drain()
+        message = await future
+        if "error" in message:
+            raise RuntimeError(message["error"])
+        return message["result"]
+
+    async def close(self):
+        """Close the connection."""
+        self._writer.close()
+        await self._writer.wait_closed()
+        await self._reading
+
+
+async def _serve(args):
+    """Run a server until cancelled."""
+    search_executor = ThreadPoolExecutor(args.search_threads) if args.search_threads else None
+    if args.search_processes:
+        search_executor = ProcessPoolExecutor(args.search_processes)
+    server = GameServer(ThreadPoolExecutor(args.workers) if args.workers else None, search_executor,
+                        args.max_moves, args.max_repetitions, args.max_search_ms)
+    listener = await server.start(args.host, args.port, args.unix)
+    print("serving on %s" % (args.unix or "%s:%d" % (args.host, args.port)))
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.shutdown()
+
+
+def main(argv=None):
+    """Command line entry point, see the description at the top of the file."""
+    parser = argparse.ArgumentParser(description="Asyncio game server for JanggiGame.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", default=None, help="listen on a Unix socket at this path instead of TCP")
+    parser.add_argument("--workers", type=int, default=None, help="threads making moves, %d by default" % MOVE_WORKERS)
+    searchers = parser.add_mutually_exclusive_group()
+    searchers.add_argument("--search-processes", type=int, default=0,
+                           help="processes running best_move searches, one per CPU by default")
+    searchers.add_argument("--search-threads", type=int, default=0,
+                           help="run best_move searches on this many threads instead of processes")
+    parser.add_argument("--instrument", action="store_true", help="count calls and time for get_metrics")
+    parser.add_argument("--max-moves", type=int, default=None, help="draw games at this turn number")
+    parser.add_argument("--max-repetitions", type=int, default=None, help="draw games when a position comes back this often")
+    parser.add_argument("--max-search-ms", type=int, default=MAX_SEARCH_MS,
+                        help="longest time a best_move search may take")
+    args = parser.parse_args(argv)
+    if args.instrument:
+        JanggiProfile.enable()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
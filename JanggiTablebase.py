@@ -0,0 +1,531 @@
+# Description: Endgame tablebases for JanggiGame: exact win, draw or loss, with the distance to mate, for every
+# position of a small material set such as a General and a Chariot against a General and two Guards.
+# A material set is written Blue first, "KC-KGG", with the letters of PIECE_TYPES. Each piece is placed on the
+# squares it can ever reach from its starting squares (the palace for Generals and Guards, the forward squares for
+# Soldiers), and a position is numbered by the mixed radix of its pieces' squares and the player to move, so a
+# table is a flat array of one byte per position, with no square list stored. Of identical pieces, only the
+# placements with their squares in increasing order are used.
+# A table is built by retrograde analysis. Worker processes generate the legal moves of every position with the
+# pieces' own move generators and check test. A capture leads into the table of the smaller material set, built
+# first and read for its result; the other moves are only counted, and no move list is kept. Then, from the
+# checkmates outward, distance by distance, the workers un-move the positions settled at that distance to get
+# the positions leading to them: a position is won if a move leads to a lost position, lost once every move leads to
+# a won position, and drawn if neither happens. Repetitions are not taken into account. Besides the value bytes,
+# the build keeps one byte per position for the moves not yet known to lose and one for the slowest losing capture.
+# A value byte is 0 for a draw, INVALID for a position that cannot occur, otherwise 1 + the number of plies to
+# mate: an even number of plies when the player to move is mated, odd when it mates.
+# Command line:
+#   python JanggiTablebase.py build MATERIAL [MATERIAL ...] [--directory DIR] [--workers N]
+#   python JanggiTablebase.py probe FEN [--directory DIR]
+
+import argparse
+import itertools
+import os
+import struct
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from JanggiGame import (JanggiGame, PIECES, PIECE_TYPES, NUM_SQUARES, BLUE_BIT, TYPE_MASK, GENERAL, CHARIOT,
+                        CANNON, EMPTY, SQUARE_NAMES)
+
+INVALID = 255
+MAX_DISTANCE = INVALID - 2          # longest distance to mate a value byte can hold
+MAX_TABLE_SIZE = 1 << 31
+
+_MAGIC = b"JANGGITB"
+_VERSION = 1
+# magic, version, Blue pieces and Red pieces padded with spaces, number of positions
+_HEADER = struct.Struct("<8sI16s16sQ")
+_CHUNK_SIZE = 1 << 14
+
+
+def _get_domains():
+    """Get, for every piece code, the squares it can reach from its starting squares, in square order."""
+    board = JanggiGame().get_board()
+    domains = [None] * (2 * BLUE_BIT)
+    for code, piece in enumerate(PIECES):
+        if not piece:
+            continue
+        squares = {sq for sq, start_code in enumerate(board) if start_code == code}
+        todo = list(squares)
+        while todo:
+            for target, _ in piece.get_empty_board_moves(todo.pop()):
+                if target not in squares:
+                    squares.add(target)
+                    todo.append(target)
+        domains[code] = tuple(sorted(squares))
+    return domains
+
+
+_DOMAINS = _get_domains()
+
+
+def parse_material(material):
+    """
+    Parse a material set such as "KC-KGG" (Blue's pieces, then Red's) into its canonical name and the tuple of
+    piece codes, Blue's first, each side in the order of PIECE_TYPES so that identical pieces are next to each other.
+    """
+    sides = material.upper().split("-")
+    if len(sides) != 2:
+        raise ValueError("expected Blue's pieces, a dash and Red's pieces: %r" % material)
+    codes = []
+    names = []
+    for letters, color_bit in zip(sides, (BLUE_BIT, 0)):
+        if letters.count("K") != 1 or any(letter not in PIECE_TYPES for letter in letters):
+            raise ValueError("expected one General and piece letters of %s: %r" % (PIECE_TYPES, letters))
+        side = sorted((PIECE_TYPES.index(letter) + 1) | color_bit for letter in letters)
+        codes.extend(side)
+        names.append("".join(PIECE_TYPES[(code & TYPE_MASK) - 1] for code in side))
+    return "-".join(names), tuple(codes)
+
+
+def _get_sub_materials(codes):
+    """Get the material sets left after one capture, as tuples of piece codes."""
+    return sorted({codes[:slot] + codes[slot + 1:] for slot, code in enumerate(codes) if code & TYPE_MASK != GENERAL})
+
+
+def _get_material_name(codes):
+    """Get the canonical name of a tuple of piece codes."""
+    return "-".join("".join(PIECE_TYPES[(code & TYPE_MASK) - 1] for code in codes if code & BLUE_BIT == color_bit)
+                    for color_bit in (BLUE_BIT, 0))
+
+
+class _Layout(object):
+    """Represents the numbering of the positions of a material set: the mixed radix of the squares of its pieces."""
+
+    def __init__(self, codes):
+        """Constructor for _Layout."""
+        self._codes = codes
+        self._domains = [_DOMAINS[code] for code in codes]
+        # index of every square in the domain of each piece, -1 off its domain
+        self._domain_index = []
+        for domain in self._domains:
+            index = [-1] * NUM_SQUARES
+            for number, sq in enumerate(domain):
+                index[sq] = number
+            self._domain_index.append(index)
+        # pieces identical to the previous one
+        self._same_as_previous = [slot > 0 and code == codes[slot - 1] for slot, code in enumerate(codes)]
+        self._size = 2
+        for domain in self._domains:
+            self._size *= len(domain)
+
+    def get_codes(self):
+        """Get the piece codes, one per slot"""
+        return self._codes
+
+    def get_size(self):
+        """Get the number of positions"""
+        return self._size
+
+    def encode(self, squares, red_to_move):
+        """
+        Get the number of the position with the pieces on squares, slot by slot, and the player to move,
+        None if a piece stands off the squares it can reach.
+        """
+        squares = list(squares)
+        # put identical pieces in increasing square order
+        for slot in range(1, len(squares)):
+            other = slot
+            while other > 0 and self._same_as_previous[other] and squares[other - 1] > squares[other]:
+                squares[other - 1], squares[other] = squares[other], squares[other - 1]
+                other -= 1
+        index = 0
+        for slot, sq in enumerate(squares):
+            number = self._domain_index[slot][sq]
+            if number < 0:
+                return None
+            index = index * len(self._domains[slot]) + number
+        return index * 2 + red_to_move
+
+    def decode(self, index):
+        """
+        Get the squares, slot by slot, and the player to move (1 for Red) of the position number index,
+        None for the squares if two pieces share a square or identical pieces are out of order.
+        """
+        red_to_move = index & 1
+        index >>= 1
+        squares = [0] * len(self._domains)
+        for slot in range(len(self._domains) - 1, -1, -1):
+            domain = self._domains[slot]
+            index, number = divmod(index, len(domain))
+            squares[slot] = domain[number]
+        for slot in range(1, len(squares)):
+            if self._same_as_previous[slot] and squares[slot - 1] >= squares[slot]:
+                return None, red_to_move
+        if len(set(squares)) != len(squares):
+            return None, red_to_move
+        return squares, red_to_move
+
+
+def _decode_value(value):
+    """Get the result for the player to move, 'WIN', 'LOSS' or 'DRAW', and the plies to mate of a value byte."""
+    if value == 0:
+        return "DRAW", None
+    plies = value - 1
+    return ("WIN" if plies % 2 else "LOSS"), plies
+
+
+def _generate_moves(board, squares, color_bit, king_pos):
+    """
+    Yield the legal moves of the player color_bit, pieces on squares, as (from square, to square) pairs, the pass
+    included, like JanggiGame's legal move generator: each move is tried on the board and the General's check tested.
+    """
+    king = PIECES[board[king_pos]]
+    for pos in squares:
+        code = board[pos]
+        if code & BLUE_BIT != color_bit:
+            continue
+        for to_pos in PIECES[code].get_valid_moves(board, pos):
+            if pos == king_pos:
+                yield pos, to_pos
+                continue
+            captured = board[to_pos]
+            board[to_pos] = code
+            board[pos] = EMPTY
+            in_check = king.can_be_captured(board, king_pos)
+            board[pos] = code
+            board[to_pos] = captured
+            if not in_check:
+                yield pos, to_pos
+    if not king.can_be_captured(board, king_pos):
+        yield king_pos, king_pos
+
+
+# tables read by a worker process, by directory and material name
+_worker_tables = {}
+
+
+def _get_worker_table(directory, name):
+    """Get the values of a table in a worker process, read once."""
+    key = (directory, name)
+    if key not in _worker_tables:
+        _worker_tables[key] = read_table(os.path.join(directory, name + ".jtb"))[1]
+    return _worker_tables[key]
+
+
+def _analyse_chunk(codes, start, stop, directory):
+    """
+    Worker: generate the moves of positions start to stop of a material set. Return three bytearrays, with for each
+    position:
+      values       its value byte as far as known before the analysis: INVALID if it cannot occur, 1 if the player
+                   to move is checkmated, the fastest capture into a lost position of a smaller table, the slowest
+                   capture into a won one if every move is such a capture, 0 otherwise
+      pending      the number of moves not yet known to lose: the moves within the table, plus one if a capture draws
+      loss_at      1 + the plies to mate of the slowest capture into a won position of a smaller table, 0 if none
+    Raise ValueError if a position has more moves within the table than a byte can count.
+    """
+    layout = _Layout(codes)
+    sub_layouts = {}
+    for slot, code in enumerate(codes):
+        if code & TYPE_MASK != GENERAL:
+            sub_codes = codes[:slot] + codes[slot + 1:]
+            sub_layouts[slot] = (_Layout(sub_codes), _get_worker_table(directory, _get_material_name(sub_codes)))
+    count = stop - start
+    values = bytearray(b"\xff" * count)
+    pending = bytearray(count)
+    loss_at = bytearray(count)
+    general_slots = [slot for slot, code in enumerate(codes) if code & TYPE_MASK == GENERAL]
+    board = bytearray(NUM_SQUARES)
+    for offset in range(count):
+        squares, red_to_move = layout.decode(start + offset)
+        if squares is None:
+            continue
+        for slot, sq in enumerate(squares):
+            board[sq] = codes[slot]
+        color_bit = 0 if red_to_move else BLUE_BIT
+        blue_king, red_king = (squares[slot] for slot in general_slots)
+        king_pos, other_king = (red_king, blue_king) if red_to_move else (blue_king, red_king)
+        # the player who just moved cannot have left its General in check
+        if not PIECES[board[other_king]].can_be_captured(board, other_king):
+            slot_of = {sq: slot for slot, sq in enumerate(squares)}
+            moves = quiet = win_at = 0
+            for pos, to_pos in _generate_moves(board, squares, color_bit, king_pos):
+                moves += 1
+                if not board[to_pos] or pos == to_pos:
+                    quiet += 1
+                    continue
+                moved = list(squares)
+                moved[slot_of[pos]] = to_pos
+                captured_slot = slot_of[to_pos]
+                del moved[captured_slot]
+                sub_layout, sub_values = sub_layouts[captured_slot]
+                value = sub_values[sub_layout.encode(moved, 1 - red_to_move)]
+                if value == 0:
+                    pending[offset] = 1
+                elif (value - 1) % 2 == 0:
+                    # the opponent is mated in value - 1 plies
+                    if not win_at or value + 1 < win_at:
+                        win_at = value + 1
+                else:
+                    loss_at[offset] = max(loss_at[offset], value + 1)
+            if quiet + pending[offset] > 255:
+                raise ValueError("a position of %s has more moves than a byte can count" % _get_material_name(codes))
+            pending[offset] += quiet
+            if not moves:
+                values[offset] = 1
+            elif win_at > MAX_DISTANCE + 1:
+                # too far to store, unless a faster win is found within the table: never let the position be lost
+                pending[offset] += 1
+                loss_at[offset] = INVALID
+                values[offset] = 0
+            else:
+                values[offset] = win_at or (loss_at[offset] if not pending[offset] else 0)
+        for sq in squares:
+            board[sq] = EMPTY
+    return values, pending, loss_at
+
+
+def _unmove_chunk(codes, start, chunk_values, value):
+    """
+    Worker: get the positions of a material set one move before the positions from start on whose value byte in
+    chunk_values is value, by un-moving each piece of the player who just moved to the empty squares it could have
+    come from, or by un-passing. Return them, one after another, as an array of position numbers; some may be
+    positions that cannot occur.
+    """
+    layout = _Layout(codes)
+    predecessors = array("I")
+    board = bytearray(NUM_SQUARES)
+    offset = chunk_values.find(value)
+    while offset >= 0:
+        index = start + offset
+        offset = chunk_values.find(value, offset + 1)
+        squares, red_to_move = layout.decode(index)
+        for slot, sq in enumerate(squares):
+            board[sq] = codes[slot]
+        # the player who just moved passed
+        predecessors.append(index ^ 1)
+        color_bit = BLUE_BIT if red_to_move else 0
+        for slot, sq in enumerate(squares):
+            code = codes[slot]
+            if code & BLUE_BIT != color_bit:
+                continue
+            piece = PIECES[code]
+            if code & TYPE_MASK in (CHARIOT, CANNON):
+                # slides are the same both ways
+                sources = [from_pos for from_pos in piece.get_valid_moves(board, sq) if not board[from_pos]]
+            else:
+                sources = [from_pos for from_pos, blockers in piece.get_empty_board_sources(sq)
+                           if not board[from_pos] and not any(board[blocker] for blocker in blockers)]
+            moved = list(squares)
+            for from_pos in sources:
+                moved[slot] = from_pos
+                predecessor = layout.encode(moved, 1 - red_to_move)
+                if predecessor is not None:
+                    predecessors.append(predecessor)
+        for sq in squares:
+            board[sq] = EMPTY
+    return predecessors
+
+
+def _solve(codes, values, pending, loss_at, executor):
+    """
+    Retrograde analysis of a table from the results of _analyse_chunk for all its positions; values is completed in
+    place. Positions are settled distance by distance from the checkmates, so each gets its shortest win or longest
+    loss: the value bytes are the frontier, the positions whose value byte is distance + 1 being settled at that
+    distance, and the value bytes above it captures not yet beaten by a faster win. The workers un-move the positions
+    of the frontier chunk by chunk, and only the chunks holding some are sent.
+    Raise ValueError if a position is more than MAX_DISTANCE plies from mate, which a value byte cannot hold.
+    """
+    for distance in range(MAX_DISTANCE + 1):
+        value = distance + 1
+        starts = [start for start in range(0, len(values), _CHUNK_SIZE)
+                  if values.find(value, start, start + _CHUNK_SIZE) >= 0]
+        chunks = executor.map(_unmove_chunk, itertools.repeat(codes), starts,
+                              [bytes(values[start:start + _CHUNK_SIZE]) for start in starts], itertools.repeat(value))
+        for predecessors in chunks:
+            for predecessor in predecessors:
+                old = values[predecessor]
+                if old == INVALID or 0 < old <= value:
+                    continue
+                if distance % 2 == 0:
+                    # a move to a lost position wins, faster than any capture found so far
+                    if value + 1 > MAX_DISTANCE + 1:
+                        raise ValueError("positions more than %d plies from mate do not fit a value byte"
+                                         % MAX_DISTANCE)
+                    values[predecessor] = value + 1
+                elif not old:
+                    pending[predecessor] -= 1
+                    if not pending[predecessor]:
+                        # every move loses: the position is lost with the slowest of them
+                        loss = max(value + 1, loss_at[predecessor])
+                        if loss > MAX_DISTANCE + 1:
+                            raise ValueError("positions more than %d plies from mate do not fit a value byte"
+                                             % MAX_DISTANCE)
+                        values[predecessor] = loss
+    if any(not values[index] for index, loss in enumerate(loss_at) if loss == INVALID):
+        raise ValueError("positions more than %d plies from mate do not fit a value byte" % MAX_DISTANCE)
+    return values
+
+
+def read_table(path):
+    """Read a table file. Return its material name and its values as bytes."""
+    with open(path, "rb") as file:
+        magic, version, blue, red, size = _HEADER.unpack(file.read(_HEADER.size))
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("%s is not a tablebase file" % path)
+        values = file.read()
+    if len(values) != size:
+        raise ValueError("%s is truncated" % path)
+    return "%s-%s" % (blue.decode("ascii").strip(), red.decode("ascii").strip()), values
+
+
+def _write_table(path, name, values):
+    """Write a table file, first to a temporary file so that a table on disk is always complete."""
+    blue, red = name.split("-")
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(_HEADER.pack(_MAGIC, _VERSION, blue.encode("ascii").ljust(16), red.encode("ascii").ljust(16),
+                                len(values)))
+        file.write(values)
+    os.replace(temporary, path)
+
+
+def build(material, directory=".", workers=None, executor=None):
+    """
+    Build the table of a material set such as "KC-KGG" and write it to directory, building the tables of the smaller
+    material sets first if they are not there yet. Return the path of the table.
+    """
+    name, codes = parse_material(material)
+    path = os.path.join(directory, name + ".jtb")
+    if os.path.exists(path):
+        return path
+    layout = _Layout(codes)
+    if layout.get_size() > MAX_TABLE_SIZE:
+        raise ValueError("material set %s has too many positions: %d" % (name, layout.get_size()))
+    if executor is None:
+        os.makedirs(directory, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            return build(material, directory, workers, executor)
+
+    for sub_codes in _get_sub_materials(codes):
+        build(_get_material_name(sub_codes), directory, workers, executor)
+
+    size = layout.get_size()
+    starts = range(0, size, _CHUNK_SIZE)
+    values, pending, loss_at = bytearray(), bytearray(), bytearray()
+    chunks = executor.map(_analyse_chunk, itertools.repeat(codes), starts,
+                          [min(start + _CHUNK_SIZE, size) for start in starts], itertools.repeat(directory))
+    for chunk in chunks:
+        values += chunk[0]
+        pending += chunk[1]
+        loss_at += chunk[2]
+    values = _solve(codes, values, pending, loss_at, executor)
+    _write_table(path, name, values)
+    return path
+
+
+class Tablebase(object):
+    """
+    Represents the tables of a directory, read when first probed. probe gives the exact result of a position whose
+    material set has a table, and best_move a move keeping the best result.
+    """
+
+    def __init__(self, directory="."):
+        """Constructor for Tablebase."""
+        self._directory = directory
+        self._tables = {}
+
+    def _get_table(self, codes):
+        """Get the layout and the values of the table of a material set, None if there is no table."""
+        if codes not in self._tables:
+            path = os.path.join(self._directory, _get_material_name(codes) + ".jtb")
+            self._tables[codes] = (_Layout(codes), read_table(path)[1]) if os.path.exists(path) else None
+        return self._tables[codes]
+
+    def _probe_board(self, board, red_to_move):
+        """
+        Get the value byte of a board and player to move, None if there is no table for its material set
+        or a piece stands off the squares it can reach.
+        """
+        pieces = sorted((code ^ BLUE_BIT, sq) for sq, code in enumerate(board) if code)
+        codes = tuple(code ^ BLUE_BIT for code, _ in pieces)
+        table = self._get_table(codes)
+        if table is None:
+            return None
+        layout, values = table
+        index = layout.encode([sq for _, sq in pieces], red_to_move)
+        return values[index] if index is not None else None
+
+    def probe(self, game):
+        """
+        Get the result of the position of game for the player to move: ('WIN', plies to mate), ('LOSS', plies to mate)
+        or ('DRAW', None), None if there is no table for its material set or the game is over.
+        """
+        if game.get_game_state() != "UNFINISHED":
+            return None
+        value = self._probe_board(game.get_board(), game.get_player() == "red")
+        if value is None or value == INVALID:
+            return None
+        return _decode_value(value)
+
+    def best_move(self, game):
+        """
+        Get a move keeping the best result for the player to move, as a (move_from, move_to) pair for make_move:
+        the fastest mate when winning, the slowest when losing. None if the position cannot be probed.
+        """
+        result = self.probe(game)
+        if result is None:
+            return None
+        player = game.get_player()
+        board = game.get_board()
+        best = None
+        for move in game.legal_moves(player):
+            game.push(move)
+            value = self._probe_board(board, game.get_player() == "red")
+            game.pop()
+            if value is None or value == INVALID:
+                continue
+            outcome, plies = _decode_value(value)
+            # rank the move from the point of view of the player to move: win fast, draw, lose slowly
+            if outcome == "LOSS":
+                rank = (2, -plies)
+            elif outcome == "DRAW":
+                rank = (1, 0)
+            else:
+                rank = (0, plies)
+            if best is None or rank > best[0]:
+                best = (rank, move)
+        if best is None:
+            return None
+        return SQUARE_NAMES[best[1][0]], SQUARE_NAMES[best[1][1]]
+
+
+def main(argv=None):
+    """Command line entry point, see the description at the top of the file."""
+    parser = argparse.ArgumentParser(description="Endgame tablebases for JanggiGame.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="build the tables of material sets")
+    build_parser.add_argument("materials", nargs="+", help='material sets, Blue first, such as "KC-KGG"')
+    build_parser.add_argument("--directory", default=".")
+    build_parser.add_argument("--workers", type=int, default=None)
+    probe_parser = commands.add_parser("probe", help="probe a position given in text notation")
+    probe_parser.add_argument("fen")
+    probe_parser.add_argument("--directory", default=".")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        for material in args.materials:
+            start = time.perf_counter()
+            path = build(material, args.directory, args.workers)
+            name, values = read_table(path)
+            counts = {"WIN": 0, "LOSS": 0, "DRAW": 0}
+            for value in set(values) - {INVALID}:
+                counts[_decode_value(value)[0]] += values.count(value)
+            print("%s: %d positions  %s  time: %.3fs" % (name, len(values), counts, time.perf_counter() - start))
+        return 0
+
+    tablebase = Tablebase(args.directory)
+    game = JanggiGame.from_fen(args.fen)
+    result = tablebase.probe(game)
+    if result is None:
+        print("no table")
+        return 1
+    print("%s %s  best move: %s" % (result[0], result[1] if result[1] is not None else "", tablebase.best_move(game)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
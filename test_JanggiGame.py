@@ -0,0 +1,268 @@
+# Description: Regression tests of JanggiGame's legal move generation and checkmate detection.
+# legal_moves is compared with a brute force trying every from/to pair with play on a copy of the game,
+# checkmates and escapes are checked on positions taken from random games, the state push and pop keep up to date
+# against the state rebuilt from the board, the draw limits, the position notations by round trips, and perft on
+# JanggiPerft's saved positions.
+# Command line:
+#   python -m unittest test_JanggiGame
+
+import random
+import unittest
+
+from JanggiGame import JanggiGame, MoveCache, NUM_SQUARES, SQUARE_NAMES
+from JanggiPerft import check_reference_counts
+
+# (position before the mating move, mating move, game state after it)
+MATES = [
+    ("4kge2/2A6/2S6/9/9/1a2h1sSC/3s5/s8/3K5/1EcG1GEa1 r UNFINISHED 171", ("d7", "d8"), "RED_WON"),
+    ("1e2g1e2/4g4/2H1ak3/2C6/9/4aS3/4E2c1/sc7/1H1K3A1/5G3 b UNFINISHED 194", ("c4", "f4"), "BLUE_WON"),
+    ("9/3S3cc/4k4/6h2/1s3s3/2C6/6e2/8A/1E2KH3/2H1GG3 b UNFINISHED 146", ("c6", "c3"), "BLUE_WON"),
+    ("9/4k4/1A7/1h6S/1H7/E8/9/e4G3/3K5/1Ac2G1a1 r UNFINISHED 287", ("c10", "d10"), "RED_WON"),
+]
+
+# (position in check where the General cannot move, the moves blocking or capturing the checking piece)
+ESCAPES = [
+    ("1e3ge2/c3hk3/1a1gh2c1/1s7/5C3/A2s1S3/1S1SS2S1/7A1/2C1HK3/1EHG1GE2 r UNFINISHED 61",
+     {("e3", "f5"), ("h3", "f3")}),
+    ("1h3ge2/c4k3/1a1gec3/1s7/7A1/A2hC1S2/1S5S1/5K3/2C1H4/1EHG1GE2 b UNFINISHED 78",
+     {("e6", "f6"), ("g6", "f6"), ("e9", "f7")}),
+    ("2h6/4gk3/3ga1c1h/s3e3s/4s1s2/1S3SS2/1S2S3E/1A7/5A3/CH2KG3 r UNFINISHED 109",
+     {("e2", "f3"), ("g3", "f3"), ("e5", "f5"), ("g5", "f5")}),
+]
+
+# the Blue Guard on e9 is pinned to its General by the Red Chariot on e5
+PINNED = "3k5/9/9/9/4c4/9/9/9/4G4/4K4 b"
+
+
+def brute_force_moves(game):
+    """Get the moves of the player to move that play accepts, trying every from/to pair on a copy of game."""
+    moves = set()
+    for pos in range(NUM_SQUARES):
+        for to_pos in range(NUM_SQUARES):
+            if game.copy().play((pos, to_pos)):
+                moves.add((pos, to_pos))
+    return moves
+
+
+class LegalMovesTest(unittest.TestCase):
+    """Tests of legal_moves, is_checkmate and the legality checks of play."""
+
+    def _check_against_brute_force(self, game):
+        """Check that legal_moves gives the moves play accepts, the pass as the General's square twice."""
+        moves = game.legal_moves(game.get_player())
+        self.assertEqual(len(moves), len(set(moves)))
+        expected = brute_force_moves(game)
+        # play accepts a pass from any piece of the player; legal_moves gives it once, from the General
+        passes = {move for move in expected if move[0] == move[1]}
+        king_pos = game._get_king_position(game._get_player())
+        if passes:
+            expected = expected - passes | {(king_pos, king_pos)}
+        self.assertEqual(set(moves), expected)
+
+    def test_legal_moves_match_brute_force(self):
+        positions = [JanggiGame(), JanggiGame.from_fen(PINNED)]
+        positions += [JanggiGame.from_fen(fen) for fen, _, _ in MATES]
+        positions += [JanggiGame.from_fen(fen) for fen, _ in ESCAPES]
+        for game in positions:
+            with self.subTest(fen=game.to_fen()):
+                self._check_against_brute_force(game)
+
+    def test_legal_moves_match_brute_force_with_move_cache(self):
+        cache = MoveCache()
+        for fen in [PINNED] + [fen for fen, _ in ESCAPES]:
+            game = JanggiGame.from_fen(fen)
+            game.set_move_cache(cache)
+            with self.subTest(fen=fen):
+                self._check_against_brute_force(game)
+
+    def test_checkmate(self):
+        for fen, (move_from, move_to), state in MATES:
+            with self.subTest(fen=fen):
+                game = JanggiGame.from_fen(fen)
+                loser = "blue" if game.get_player() == "red" else "red"
+                self.assertFalse(game.is_checkmate(loser))
+                self.assertTrue(game.make_move(move_from, move_to))
+                self.assertEqual(game.get_game_state(), state)
+                self.assertTrue(game.is_in_check(loser))
+                self.assertTrue(game.is_checkmate(loser))
+                self.assertEqual(game.legal_moves(loser), [])
+                self.assertFalse(game.make_move(move_from, move_to))
+
+    def test_escape_by_blocking_or_capturing(self):
+        for fen, escapes in ESCAPES:
+            with self.subTest(fen=fen):
+                game = JanggiGame.from_fen(fen)
+                player = game.get_player()
+                self.assertTrue(game.is_in_check(player))
+                self.assertFalse(game.is_checkmate(player))
+                moves = {(SQUARE_NAMES[pos], SQUARE_NAMES[to_pos]) for pos, to_pos in game.legal_moves(player)}
+                self.assertEqual(moves, escapes)
+                # no pass while in check
+                king = SQUARE_NAMES[game._get_king_position(game._get_player())]
+                self.assertFalse(game.make_move(king, king))
+                move_from, move_to = sorted(escapes)[0]
+                self.assertTrue(game.make_move(move_from, move_to))
+                self.assertFalse(game.is_in_check(player))
+
+    def test_pinned_piece_cannot_move(self):
+        game = JanggiGame.from_fen(PINNED)
+        self.assertFalse(game.make_move("e9", "d9"))
+        self.assertEqual(game.get_player(), "blue")
+        moves = {(SQUARE_NAMES[pos], SQUARE_NAMES[to_pos]) for pos, to_pos in game.legal_moves("blue")}
+        self.assertNotIn(("e9", "d9"), moves)
+        self.assertIn(("e10", "e10"), moves)
+
+
+class PushPopTest(unittest.TestCase):
+    """Tests of the incremental state kept by push and pop against the state rebuilt from the board."""
+
+    def _check_incremental_state(self, game):
+        """Check the Zobrist key, the line occupancy and the piece lists against those of _index_pieces on a copy."""
+        rebuilt = game.copy()
+        rebuilt._index_pieces()
+        self.assertEqual(game.get_zobrist_key(), rebuilt.get_zobrist_key())
+        self.assertEqual(game.get_occupancy(), rebuilt.get_occupancy())
+        self.assertEqual(game._piece_squares, rebuilt._piece_squares)
+        self.assertEqual(game._king_squares, rebuilt._king_squares)
+
+    def test_incremental_state_matches_rebuilt_state(self):
+        for seed in range(5):
+            rng = random.Random(seed)
+            game = JanggiGame()
+            start = (bytes(game.get_board()), game.get_player(), game.to_fen(), game.get_zobrist_key(),
+                     dict(game._position_counts))
+            with self.subTest(seed=seed):
+                for _ in range(80):
+                    moves = game.legal_moves(game.get_player())
+                    if not moves:
+                        break
+                    # try a move and take it back before playing another one
+                    game.push(rng.choice(moves))
+                    self._check_incremental_state(game)
+                    game.pop()
+                    self._check_incremental_state(game)
+                    game.push(rng.choice(moves))
+                    self._check_incremental_state(game)
+                while game._undo_stack:
+                    game.pop()
+                    self._check_incremental_state(game)
+                self.assertEqual((bytes(game.get_board()), game.get_player(), game.to_fen(), game.get_zobrist_key(),
+                                  game._position_counts), start)
+
+
+class DrawTest(unittest.TestCase):
+    """Tests of the draw limits of set_draw_limits."""
+
+    SHUFFLE = [("a10", "a9"), ("a1", "a2"), ("a9", "a10"), ("a2", "a1")]
+
+    def test_repetition_draw(self):
+        game = JanggiGame(max_repetitions=3)
+        self.assertEqual(game.get_repetition_count(), 1)
+        for move_from, move_to in self.SHUFFLE:
+            self.assertTrue(game.make_move(move_from, move_to))
+        self.assertEqual(game.get_repetition_count(), 2)
+        for move_from, move_to in self.SHUFFLE[:-1]:
+            self.assertTrue(game.make_move(move_from, move_to))
+            self.assertEqual(game.get_game_state(), "UNFINISHED")
+        # the starting position comes back a third time
+        self.assertTrue(game.make_move(*self.SHUFFLE[-1]))
+        self.assertEqual(game.get_repetition_count(), 3)
+        self.assertEqual(game.get_game_state(), "DRAW")
+        self.assertFalse(game.make_move(*self.SHUFFLE[0]))
+
+        # taking the move back takes the draw and the repetition back
+        self.assertEqual(game.pop(), (SQUARE_NAMES.index("a2"), SQUARE_NAMES.index("a1")))
+        self.assertEqual(game.get_game_state(), "UNFINISHED")
+        self.assertEqual(game.get_repetition_count(), 2)
+        self.assertTrue(game.make_move(*self.SHUFFLE[-1]))
+        self.assertEqual(game.get_game_state(), "DRAW")
+
+    def test_max_moves(self):
+        game = JanggiGame(max_moves=4)
+        for move_from, move_to in self.SHUFFLE[:3]:
+            self.assertTrue(game.make_move(move_from, move_to))
+            self.assertEqual(game.get_game_state(), "UNFINISHED")
+        self.assertTrue(game.make_move(*self.SHUFFLE[3]))
+        self.assertEqual(game.get_game_state(), "DRAW")
+        self.assertFalse(game.make_move("a7", "a6"))
+        game.pop()
+        self.assertEqual(game.get_game_state(), "UNFINISHED")
+        # without limits the game goes on
+        game.set_draw_limits()
+        self.assertTrue(game.make_move(*self.SHUFFLE[3]))
+        self.assertEqual(game.get_game_state(), "UNFINISHED")
+
+    def test_checkmate_wins_over_draw(self):
+        for fen, (move_from, move_to), state in MATES:
+            with self.subTest(fen=fen):
+                game = JanggiGame.from_fen(fen)
+                # the mating move reaches the move limit
+                game.set_draw_limits(max_moves=game._turn + 1, max_repetitions=1)
+                self.assertTrue(game.make_move(move_from, move_to))
+                self.assertEqual(game.get_game_state(), state)
+
+
+class NotationTest(unittest.TestCase):
+    """Tests of the text and binary position notations."""
+
+    def _positions(self):
+        """Get the games at the positions of a few random games, and the test positions."""
+        games = [JanggiGame.from_fen(PINNED)] + [JanggiGame.from_fen(fen) for fen, _, _ in MATES]
+        for seed in range(3):
+            rng = random.Random(seed)
+            game = JanggiGame()
+            for _ in range(60):
+                moves = game.legal_moves(game.get_player())
+                if not moves:
+                    break
+                game.push(rng.choice(moves))
+                games.append(game.copy())
+        return games
+
+    def test_fen_round_trip(self):
+        for game in self._positions():
+            fen = game.to_fen()
+            with self.subTest(fen=fen):
+                other = JanggiGame.from_fen(fen)
+                self.assertEqual(other.to_fen(), fen)
+                self.assertEqual(other.get_board(), game.get_board())
+                self.assertEqual(other.get_player(), game.get_player())
+                self.assertEqual(other.get_zobrist_key(), game.get_zobrist_key())
+
+    def test_bytes_round_trip(self):
+        for game in self._positions():
+            with self.subTest(fen=game.to_fen()):
+                other = JanggiGame.from_bytes(game.to_bytes())
+                self.assertEqual(other.get_board(), game.get_board())
+                self.assertEqual(other.get_player(), game.get_player())
+                self.assertEqual(other.get_game_state(), game.get_game_state())
+                self.assertEqual(other.get_zobrist_key(), game.get_zobrist_key())
+                self.assertEqual(other.to_bytes(), game.to_bytes())
+
+    def test_invalid_notation(self):
+        placement = JanggiGame().to_fen().split()[0]
+        for fen in (placement + " b UNFINISHED 1", placement + " r UNFINISHED 4", placement + " b UNFINISHED x",
+                    placement + " g", placement + " b OVER 0", "9/9 b", placement.replace("K", "1", 1) + " b"):
+            with self.subTest(fen=fen):
+                with self.assertRaises(ValueError):
+                    JanggiGame.from_fen(fen)
+        with self.assertRaises(ValueError):
+            JanggiGame.from_bytes(JanggiGame().to_bytes()[:-1])
+        # the turn number may be left out
+        self.assertEqual(JanggiGame.from_fen(placement + " r").to_fen(), placement + " r UNFINISHED 1")
+
+
+class PerftTest(unittest.TestCase):
+    """Tests of the move generator against the perft reference counts of JanggiPerft."""
+
+    def test_reference_counts(self):
+        self.assertEqual(check_reference_counts(3), [])
+
+    def test_reference_counts_with_move_cache(self):
+        cache = MoveCache()
+        self.assertEqual(check_reference_counts(3, cache), [])
+        self.assertGreater(cache.get_stats()["move_hits"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
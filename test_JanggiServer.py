@@ -0,0 +1,82 @@
+# Description: Tests of JanggiServer: a GameServer on a free port is driven by a JanggiClient through a game,
+# a move event to a subscriber, a search and the error answers.
+# Command line:
+#   python -m unittest test_JanggiServer
+
+import unittest
+
+from JanggiGame import SQUARE_NAMES
+from JanggiServer import GameServer, JanggiClient
+
+
+class GameServerTest(unittest.IsolatedAsyncioTestCase):
+    """Tests of GameServer over TCP, with its default executors."""
+
+    async def asyncSetUp(self):
+        self._server = GameServer(max_search_ms=2000)
+        self._listener = await self._server.start(port=0)
+        port = self._listener.sockets[0].getsockname()[1]
+        self._client = await JanggiClient.connect(port=port)
+
+    async def asyncTearDown(self):
+        await self._client.close()
+        self._listener.close()
+        await self._listener.wait_closed()
+        self._server.shutdown()
+
+    async def test_game(self):
+        client = self._client
+        game_id = await client.request("new_game")
+        self.assertEqual(len(self._server), 1)
+        self.assertEqual(await client.request("get_game_state", game=game_id), "UNFINISHED")
+        self.assertEqual(await client.request("get_player", game=game_id), "blue")
+        self.assertTrue(await client.request("subscribe", game=game_id))
+        self.assertTrue(await client.request("make_move", game=game_id, move_from="a7", move_to="a6"))
+        event = await client.get_events().get()
+        self.assertEqual(event, {"event": "move", "game": game_id, "move_from": "a7", "move_to": "a6",
+                                 "captured": None, "state": "UNFINISHED", "player": "red"})
+        self.assertEqual(await client.request("get_player", game=game_id), "red")
+        # an illegal move is answered False and changes nothing
+        self.assertFalse(await client.request("make_move", game=game_id, move_from="a4", move_to="a6"))
+        self.assertFalse(await client.request("is_in_check", game=game_id, player="red"))
+
+        move = await client.request("best_move", game=game_id, depth=1)
+        self.assertEqual(len(move), 2)
+        self.assertTrue(all(name in SQUARE_NAMES for name in move))
+        self.assertTrue(await client.request("make_move", game=game_id, move_from=move[0], move_to=move[1]))
+        self.assertEqual((await client.get_events().get())["player"], "blue")
+
+        self.assertTrue(await client.request("close_game", game=game_id))
+        self.assertEqual(len(self._server), 0)
+
+    async def test_game_from_fen(self):
+        fen = "3k5/9/9/9/4c4/9/9/9/4G4/4K4 b UNFINISHED 2"
+        game_id = await self._client.request("new_game", game="pinned", fen=fen)
+        self.assertEqual(game_id, "pinned")
+        self.assertEqual(await self._client.request("get_fen", game=game_id), fen)
+
+    async def test_errors(self):
+        client = self._client
+        game_id = await client.request("new_game")
+        bad_requests = [
+            ("make_move", {"game": "nope", "move_from": "a7", "move_to": "a6"}, "unknown game"),
+            ("make_move", {"game": game_id, "move_from": "a7"}, "missing or invalid field: move_to"),
+            ("get_player", {}, "missing or invalid field: game"),
+            ("is_in_check", {"game": game_id, "player": "green"}, "player must be"),
+            ("best_move", {"game": game_id, "depth": 0}, "depth must be at least 1"),
+            ("best_move", {"game": game_id, "depth": "3"}, "missing or invalid field: depth"),
+            ("new_game", {"game": game_id}, "invalid or existing game id"),
+            ("new_game", {"fen": "not a fen"}, ""),
+            ("resign", {"game": game_id}, "unknown op"),
+        ]
+        for op, fields, message in bad_requests:
+            with self.subTest(op=op, fields=fields):
+                with self.assertRaises(RuntimeError) as raised:
+                    await client.request(op, **fields)
+                self.assertIn(message, str(raised.exception))
+        # the connection still answers after the errors
+        self.assertEqual(await client.request("get_game_state", game=game_id), "UNFINISHED")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+# Description: Tests of JanggiTablebase: a table is built into a temporary directory, and the result of every
+# position is checked against the results of the positions its legal moves lead to, and some against an exhaustive
+# search. Building KCC-K takes a minute or more, so its test runs only when JANGGI_SLOW_TESTS is set.
+# Command line:
+#   python -m unittest test_JanggiTablebase
+
+import os
+import random
+import tempfile
+import unittest
+
+import JanggiTablebase
+from JanggiGame import JanggiGame, NUM_SQUARES
+from JanggiTablebase import INVALID, Tablebase, build, parse_material, read_table
+
+
+def position(layout, codes, index):
+    """Get a game at position number index of a table, None if the position cannot be numbered."""
+    squares, red_to_move = layout.decode(index)
+    if squares is None:
+        return None
+    board = bytearray(NUM_SQUARES)
+    for sq, code in zip(squares, codes):
+        board[sq] = code
+    return JanggiGame._from_position(board, red_to_move, "UNFINISHED")
+
+
+def expected_result(tablebase, game):
+    """Get the result of game from the results of the positions its legal moves lead to."""
+    results = []
+    for move in game.legal_moves(game.get_player()):
+        game.push(move)
+        results.append(tablebase.probe(game))
+        game.pop()
+    if not results:
+        return "LOSS", 0
+    wins = [plies + 1 for outcome, plies in results if outcome == "LOSS"]
+    if wins:
+        return "WIN", min(wins)
+    if all(outcome == "WIN" for outcome, _ in results):
+        return "LOSS", max(plies for _, plies in results) + 1
+    return "DRAW", None
+
+
+def search(game, plies):
+    """Get 1 if the player to move mates within plies, -1 if mated within plies, 0 otherwise, searching every move."""
+    moves = game.legal_moves(game.get_player())
+    if not moves:
+        return -1
+    if not plies:
+        return 0
+    best = -1
+    for move in moves:
+        game.push(move)
+        best = max(best, -search(game, plies - 1))
+        game.pop()
+        if best == 1:
+            break
+    return best
+
+
+class TablebaseTest(unittest.TestCase):
+    """Tests of build, read_table and Tablebase."""
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self._directory.cleanup)
+
+    def _check_table(self, material, sample=None, max_plies=0):
+        """
+        Build the table of material and check the result of its positions, or of sample of them, against the results
+        after their moves; check those mated within max_plies, and some of the draws, with search.
+        """
+        path = build(material, self._directory.name, workers=1)
+        name, values = read_table(path)
+        self.assertEqual(name, parse_material(material)[0])
+        codes = parse_material(material)[1]
+        layout = JanggiTablebase._Layout(codes)
+        self.assertEqual(len(values), layout.get_size())
+        tablebase = Tablebase(self._directory.name)
+        indices = [index for index, value in enumerate(values) if value != INVALID]
+        if sample is not None:
+            indices = random.Random(1).sample(indices, sample)
+        for index in indices:
+            game = position(layout, codes, index)
+            result = tablebase.probe(game)
+            with self.subTest(fen=game.to_fen()):
+                self.assertEqual(result, expected_result(tablebase, game))
+                outcome, plies = result
+                if outcome == "DRAW":
+                    if index % 97 == 0:
+                        self.assertEqual(search(game, 3), 0)
+                elif plies <= max_plies:
+                    self.assertEqual(search(game, plies), 1 if outcome == "WIN" else -1)
+                    if plies:
+                        self.assertEqual(search(game, plies - 1), 0)
+        return tablebase
+
+    def test_chariot_cannot_mate_alone(self):
+        self._check_table("KC-K")
+        self.assertTrue(os.path.exists(os.path.join(self._directory.name, "K-K.jtb")))
+        tablebase = Tablebase(self._directory.name)
+        game = JanggiGame.from_fen("4k4/9/9/9/9/9/9/9/C8/4K4 b UNFINISHED 2")
+        self.assertEqual(tablebase.probe(game), ("DRAW", None))
+        # no table for the starting position
+        self.assertIsNone(tablebase.probe(JanggiGame()))
+
+    @unittest.skipUnless(os.environ.get("JANGGI_SLOW_TESTS"), "set JANGGI_SLOW_TESTS to build KCC-K")
+    def test_two_chariots(self):
+        tablebase = self._check_table("KCC-K", sample=300, max_plies=3)
+        game = JanggiGame.from_fen("4k4/9/9/9/9/9/9/9/C7C/4K4 b UNFINISHED 2")
+        self.assertEqual(tablebase.probe(game)[0], "WIN")
+        move_from, move_to = tablebase.best_move(game)
+        self.assertTrue(game.make_move(move_from, move_to))
+
+
+if __name__ == "__main__":
+    unittest.main()